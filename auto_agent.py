@@ -1,368 +1,2130 @@
+import argparse
+import bisect
+import contextlib
+import functools
+import io
+import json
+import mmap
+import multiprocessing
 import os
 import sys
 import subprocess
 import csv
-import hashlib
+import queue
+import random
+import re
+import signal
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from process_tree import run_in_process_group
+from todo_parser import (PromptSimilarityIndex, TaskRecord, hash_prompt, load_todo_index, normalize_task_line,
+                         parse_pending_tasks)
 
 # --- Configuration ---
 TODO_FILENAME = "TODO.md"
-TRACKING_FILE = "jules_tasks.csv"
+TODO_ARCHIVE_FILENAME = "TODO.archive.md"  # Next to TODO.md; receives Completed entries rolled out of it.
+COMPLETED_KEEP_RECENT = None      # Keep this many newest Completed entries in TODO.md and archive the rest; None keeps all.
+TRACKING_FILE = "jules_tasks.csv"    # Legacy tracking file; imported into TRACKING_DB once.
+TRACKING_DB = "jules_tasks.db"
 GIT_REMOTE_NAME = "origin"
 MAIN_BRANCH_NAME = "main"
+GIT_WORKTREE_DIR = ".jules/worktree"  # Detached checkout of the remote main branch used for all automated edits.
 JULES_EXECUTABLE_PATH = "C:/Users/power/AppData/Roaming/npm/jules.cmd"
+CREATE_MAX_WORKERS = 4            # Max number of `jules remote new` processes running at once.
+CREATE_RATE_PER_SECOND = 1.0      # Sustained rate of session creations (token bucket refill rate).
+CREATE_RATE_BURST = 2             # Number of creations allowed back-to-back before throttling.
+CREATE_MAX_ATTEMPTS = 3           # Attempts per task before giving up on a failing CLI call.
+CREATE_RETRY_BASE_DELAY = 2.0     # Seconds; doubled on every retry, plus jitter.
+CREATE_TIMEOUT_SECONDS = 300      # A CLI call that takes longer than this is killed (with its children) and treated as failed.
+COMMAND_KILL_GRACE = 5            # Seconds to collect a killed command's output before giving up on its pipes.
+PR_MODE = "batch"                 # "batch": one branch/PR per review run. "per-task": one per completed session.
+WATCH_MIN_POLL_INTERVAL = 30      # Seconds between status polls while sessions are moving.
+WATCH_MAX_POLL_INTERVAL = 900     # Upper bound for the poll interval when nothing changes.
+WATCH_BACKOFF_FACTOR = 2.0        # Poll interval multiplier after a poll with no status changes.
+WATCH_STATUS_CACHE_TTL = 20       # Seconds a `jules remote list` result is reused before re-fetching.
+WATCH_GIT_SYNC_INTERVAL = 120     # Seconds between fetches of the remote main branch (and TODO.md).
+WATCH_NEAR_COMPLETION_STATUSES = {"IN_PROGRESS", "AWAITING_USER_FEEDBACK"}  # Keep polling fast while any session is in one of these.
+SYNC_PAGE_SIZE = 500              # Sessions handed to the sync matcher per page of the streamed listing.
+SYNC_MIN_MATCH_CHARS = 12         # Shorter (normalized) descriptions or first lines are too generic to adopt on.
+SCHEDULER_MAX_RUNNING = 10        # Remote concurrency limit: sessions allowed to be running at once.
+SCHEDULER_RUNNING_STATUSES = ("QUEUED", "PLANNING", "AWAITING_PLAN_APPROVAL", "AWAITING_USER_FEEDBACK", "IN_PROGRESS")  # Remote statuses that hold a slot; so do sessions with no status seen yet.
+SCHEDULER_ROLE_QUOTAS = {"Programmer": 5, "Artist": 3, "Researcher": 2}  # Max running sessions per TODO.md role.
+SCHEDULER_DEFAULT_ROLE_QUOTA = 2  # Quota for roles not listed above (and for blocks without a role heading).
+SCHEDULER_LEND_IDLE_QUOTA = True  # Let roles with queued work use slots other roles' quotas leave idle.
+PROMPT_IDENTITY_VERSION = "normalized-v2"  # Bump with any change to todo_parser.hash_prompt; tracked hashes are recomputed.
+PROMPT_SIMILARITY_THRESHOLD = 0.75  # Word-pair overlap above which an untracked task is an edit of a tracked one.
+CONTROLLER_SOCKET = ".jules/controller.sock"  # Unix socket of the resident controller (`serve` mode).
+CONTROLLER_STATUS_TTL = 60        # Seconds before `status` requests trigger a background status refresh.
+CONTROLLER_JOB_HISTORY = 50       # Finished controller jobs kept for `status --job`.
+CONTROLLER_CLIENT_TIMEOUT = 5     # Seconds the thin client waits for a reply (unless --wait).
+FANOUT_MAX_PROCESSES = 4          # Repositories processed at once by --manifest runs.
+FANOUT_MAX_ACTIVE_SESSIONS = 15   # Cap on ACTIVE Jules sessions summed over every repository in the manifest.
 # --- End Configuration ---
 
-# ... (All functions from Section 0 and 1 are unchanged) ...
+#==============================================================================
+# INSTRUMENTATION
+#==============================================================================
+class Metrics:
+    """
+    Run-wide measurements: wall time per stage, a latency histogram per
+    external command (keyed like "git fetch" or "jules remote new") and task
+    counters. Thread-safe, since the create engine records from its workers.
+    Exported with --metrics-json and --metrics-prom.
+    """
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, mode: str = ""):
+        self.lock = threading.Lock()
+        self.reset(mode)
+
+    def reset(self, mode: str = ""):
+        with self.lock:
+            self.mode = mode
+            self.started_at = time.time()
+            self.stages = {}
+            self.commands = {}
+            self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stage = self.stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+                stage["count"] += 1
+                stage["total_s"] += elapsed
+                stage["max_s"] = max(stage["max_s"], elapsed)
+
+    def observe_command(self, key: str, seconds: float, failed: bool):
+        with self.lock:
+            command = self.commands.setdefault(
+                key, {"count": 0, "failures": 0, "sum_s": 0.0, "max_s": 0.0, "buckets": [0] * len(self.LATENCY_BUCKETS)})
+            command["count"] += 1
+            command["failures"] += int(failed)
+            command["sum_s"] += seconds
+            command["max_s"] = max(command["max_s"], seconds)
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound: command["buckets"][i] += 1  # Cumulative, as in Prometheus.
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other: "Metrics"):
+        """Adds everything `other` recorded (e.g. one controller job) to this run's totals."""
+        snapshot = other.snapshot()
+        with self.lock:
+            for name, stage in snapshot["stages"].items():
+                total = self.stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+                total["count"] += stage["count"]
+                total["total_s"] += stage["total_s"]
+                total["max_s"] = max(total["max_s"], stage["max_s"])
+            for key, command in snapshot["commands"].items():
+                total = self.commands.setdefault(
+                    key, {"count": 0, "failures": 0, "sum_s": 0.0, "max_s": 0.0, "buckets": [0] * len(self.LATENCY_BUCKETS)})
+                for field in ("count", "failures", "sum_s"): total[field] += command[field]
+                total["max_s"] = max(total["max_s"], command["max_s"])
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], command["buckets"].values())]
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec="seconds"),
+                "duration_s": time.time() - self.started_at,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "commands": {key: {**command, "buckets": dict(zip(map(str, self.LATENCY_BUCKETS), command["buckets"]))}
+                             for key, command in self.commands.items()},
+                "counters": dict(self.counters),
+            }
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_prometheus(self, path: str):
+        """Writes a node_exporter textfile-collector file (via temp file + rename, as the collector requires)."""
+        def labels(**values) -> str:
+            escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                       for k, v in values.items())
+            return "{" + ",".join(escaped) + "}"
+
+        snapshot = self.snapshot()
+        mode = snapshot["mode"]
+        lines = [
+            "# HELP auto_agent_last_run_timestamp_seconds Unix time the run started.",
+            "# TYPE auto_agent_last_run_timestamp_seconds gauge",
+            f"auto_agent_last_run_timestamp_seconds{labels(mode=mode)} {self.started_at:.3f}",
+            "# HELP auto_agent_run_duration_seconds Wall time of the whole run.",
+            "# TYPE auto_agent_run_duration_seconds gauge",
+            f"auto_agent_run_duration_seconds{labels(mode=mode)} {snapshot['duration_s']:.6f}",
+            "# HELP auto_agent_stage_duration_seconds Wall time spent in each stage during the run.",
+            "# TYPE auto_agent_stage_duration_seconds gauge",
+        ]
+        lines += [f"auto_agent_stage_duration_seconds{labels(mode=mode, stage=name)} {stage['total_s']:.6f}"
+                  for name, stage in sorted(snapshot["stages"].items())]
+        lines += ["# HELP auto_agent_command_duration_seconds Latency of external commands.",
+                  "# TYPE auto_agent_command_duration_seconds histogram"]
+        for key, command in sorted(self.commands.items()):
+            for bound, count in zip(self.LATENCY_BUCKETS, command["buckets"]):
+                lines.append(f"auto_agent_command_duration_seconds_bucket{labels(mode=mode, command=key, le=bound)} {count}")
+            lines.append(f"auto_agent_command_duration_seconds_bucket{labels(mode=mode, command=key, le='+Inf')} {command['count']}")
+            lines.append(f"auto_agent_command_duration_seconds_sum{labels(mode=mode, command=key)} {command['sum_s']:.6f}")
+            lines.append(f"auto_agent_command_duration_seconds_count{labels(mode=mode, command=key)} {command['count']}")
+        lines += ["# HELP auto_agent_command_failures Commands that exited non-zero or could not run.",
+                  "# TYPE auto_agent_command_failures gauge"]
+        lines += [f"auto_agent_command_failures{labels(mode=mode, command=key)} {command['failures']}"
+                  for key, command in sorted(self.commands.items())]
+        lines += ["# HELP auto_agent_tasks Tasks handled during the run, by event.",
+                  "# TYPE auto_agent_tasks gauge"]
+        lines += [f"auto_agent_tasks{labels(mode=mode, event=name)} {value}"
+                  for name, value in sorted(snapshot["counters"].items())]
+        with open(f"{path}.tmp", 'w', encoding='utf-8', newline='\n') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+METRICS = Metrics()
+
+def timed_stage(name: str):
+    """Decorator recording the wrapped function's wall time as stage `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
 
-def update_todo_for_completion(full_prompt_text: str) -> bool:
+def _command_key(command: list[str]) -> str:
+    """Groups commands for the latency histograms, e.g. "git fetch", "jules remote new", "gh pr create"."""
+    executable = os.path.splitext(os.path.basename(command[0]))[0]
+    args = list(command[1:])
+    if executable == "git":
+        while len(args) >= 2 and args[0] == "-C": args = args[2:]
+        return " ".join([executable] + args[:1])
+    return " ".join([executable] + [arg for arg in args[:2] if not arg.startswith("-")])
+
+def run_command(command: list[str], timeout: float | None = None, **kwargs) -> subprocess.CompletedProcess:
     """
-    --- COMPLETELY REWRITTEN FUNCTION ---
-    Fully automates the update of TODO.md:
-    1. Finds the exact task block in the "Pending" section.
-    2. Deletes that block.
-    3. Adds a new, formatted block to the "Completed" section.
+    subprocess.run() that records the call's latency in METRICS. With a
+    `timeout`, the command runs in its own process group, which is killed as
+    a whole when the timeout expires (see process_tree).
     """
-    print(f"  - Starting fully automated update of {TODO_FILENAME}...")
+    started = time.perf_counter()
+    failed = True
     try:
-        with open(TODO_FILENAME, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
-        # --- Step 1: Find the block to delete in the Pending section ---
-        pending_start_index = -1
-        completed_start_index = -1
-        for i, line in enumerate(lines):
-            if line.strip().startswith('## **Pending Tasks**'):
-                pending_start_index = i
-            elif line.strip().startswith('## **Completed Tasks**'):
-                completed_start_index = i
-                break # Stop once we've found both
-
-        if pending_start_index == -1:
+        if timeout is None:
+            result = subprocess.run(command, **kwargs)
+        else:
+            result = run_in_process_group(command, timeout, COMMAND_KILL_GRACE, **kwargs)
+        failed = result.returncode != 0
+        return result
+    finally:
+        METRICS.observe_command(_command_key(command), time.perf_counter() - started, failed)
+
+def _error_details(e: Exception):
+    """The failed command's stderr when it captured any, otherwise the exception itself."""
+    stderr = getattr(e, "stderr", None)
+    return stderr.strip() if isinstance(stderr, str) and stderr.strip() else e
+
+def _write_ranges(out_file, view: memoryview, edits: list[tuple[int, int, bytes]]):
+    """Writes `view` with every (start, end, replacement) edit applied; untouched ranges are copied without buffering."""
+    cursor = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0]):
+        out_file.write(view[cursor:start])
+        out_file.write(replacement)
+        cursor = end
+    out_file.write(view[cursor:])
+
+def _append_to_archive(archive_path: str, entries: list, newline: str):
+    """
+    Appends archived Completed entries to the archive as one batch ending in
+    '---' and fsyncs before TODO.md drops them. Batches go oldest first so the
+    file is only ever appended to; within a batch, entries keep TODO.md's
+    newest-first order.
+    """
+    entries = [entry for entry in entries if len(entry)]
+    is_new = not os.path.exists(archive_path)
+    with open(archive_path, 'ab') as f:
+        if is_new:
+            header = ("# Completed Tasks Archive\n\nOlder entries moved out of TODO.md. Each archiving run appends "
+                      "one batch below the previous ones; within a batch, newest first.\n\n---\n")
+            f.write(header.replace("\n", newline).encode('utf-8'))
+        for entry in entries:
+            f.write(entry)
+        if bytes(entries[-1][-16:]).rstrip().rsplit(b"\n", 1)[-1].strip() != b"---":
+            if bytes(entries[-1][-1:]) != b"\n": f.write(newline.encode())
+            f.write(f"---{newline}".encode())
+        f.flush()
+        os.fsync(f.fileno())
+
+@timed_stage("completion")
+def apply_todo_completions(full_prompt_texts: list[str], todo_path: str | None = None,
+                           keep_completed: int | None = None) -> set[str]:
+    """
+    Moves every given prompt from the "Pending" section of TODO.md to the
+    "Completed" section in a single pass:
+    1. Looks the prompts up in the cached byte-offset block index (see todo_parser).
+    2. Maps the file with mmap and splices out every matched block's byte range.
+    3. Inserts one formatted block per completion under the Completed header.
+    4. With `keep_completed` (default COMPLETED_KEEP_RECENT), keeps only the
+       newest `keep_completed` Completed entries, counting the new ones, and
+       appends the rest to TODO_ARCHIVE_FILENAME as one batch.
+    5. Streams the mapping with the edits applied to a temporary file and
+       atomically renames it over TODO.md.
+    Returns the prompts that were found and moved.
+    """
+    todo_path = todo_path or worktree_todo_path()
+    keep_completed = COMPLETED_KEEP_RECENT if keep_completed is None else keep_completed
+    print(f"  - Applying {len(full_prompt_texts)} completion(s) to {todo_path}...")
+    try:
+        # --- Step 1: Find the blocks in the Pending section ---
+        todo_index = load_todo_index(todo_path)
+        if "pending" not in todo_index.sections:
             print("  - ERROR: Could not find '## **Pending Tasks**' section.")
-            return False
-
-        block_start_line = -1
-        block_end_line = -1
-        current_block_lines = []
-        in_a_block = False
-
-        # Search only within the pending section for the task
-        for i in range(pending_start_index, completed_start_index if completed_start_index != -1 else len(lines)):
-            line = lines[i]
-            if line.strip() == '---':
-                if not in_a_block:
-                    in_a_block = True
-                    block_start_line = i
-                    current_block_lines = []
-                else: # This is the end of a block
-                    in_a_block = False
-                    block_end_line = i
-                    
-                    # Parse the prompt from the captured block
-                    task_lines = []
-                    is_task_section = False
-                    for block_line in current_block_lines:
-                        if block_line.strip() == '- **Task:**':
-                            is_task_section = True
-                            continue
-                        if is_task_section and block_line.strip():
-                            task_lines.append(block_line.strip())
-                    
-                    extracted_prompt = "\n".join(task_lines)
-
-                    # Check if we found the correct block
-                    if extracted_prompt == full_prompt_text:
-                        break # We found our block, exit the loop
-                    else: # Reset for the next block
-                        block_start_line = -1
-                        block_end_line = -1
-            elif in_a_block:
-                current_block_lines.append(line)
-        
-        if block_start_line == -1 or block_end_line == -1:
-            print(f"  - ERROR: Could not find the exact task block to delete in the Pending section.")
-            return False
-
-        print(f"  - Found task block from line {block_start_line + 1} to {block_end_line + 1}. Deleting it.")
-        
-        # --- Step 2: Create the new list of lines with the block removed ---
-        remaining_lines = lines[:block_start_line] + lines[block_end_line + 1:]
-
-        # --- Step 3: Add the new block to the Completed section ---
-        # We need to find the new index of the completed section header
-        new_completed_start_index = -1
-        for i, line in enumerate(remaining_lines):
-            if line.strip().startswith('## **Completed Tasks**'):
-                new_completed_start_index = i
-                break
-        
-        if new_completed_start_index == -1:
-            print("  - ERROR: Could not find '## **Completed Tasks**' section after deleting block.")
-            return False
-
-        completed_block_text = f"---\n\n### **[AUTO-COMPLETED]**\n- **Status:** Complete\n- **Task:**\n{full_prompt_text}\n"
-        
-        # Insert the new block right after the '---' under the completed header
-        insert_position = new_completed_start_index + 2
-        remaining_lines.insert(insert_position, completed_block_text)
-        
-        print("  - Adding new completed task block to the Completed section.")
-
-        # --- Step 4: Write the updated content back to the file ---
-        with open(TODO_FILENAME, 'w', encoding='utf-8') as f:
-            f.writelines(remaining_lines)
-        
-        print(f"  - Successfully updated and reorganized {TODO_FILENAME}.")
-        return True
+            return set()
+        if "completed" not in todo_index.sections:
+            print("  - ERROR: Could not find '## **Completed Tasks**' section.")
+            return set()
+        block_index = {}
+        for record in todo_index.pending():
+            block_index.setdefault(record.prompt_hash, record)
+
+        applied = []
+        completed_prompts = []
+        removed_ranges = []
+        for full_prompt_text in dict.fromkeys(full_prompt_texts):
+            # Matched on the prompt's identity, so a block reflowed or renumbered since it was tracked is still found.
+            record = block_index.get(hash_prompt(full_prompt_text))
+            if record is None:
+                print(f"  - ERROR: Could not find the task block for '{full_prompt_text.splitlines()[0]}' in the Pending section.")
+                continue
+            print(f"  - Found task block at bytes {record.start}-{record.end}. Deleting it.")
+            removed_ranges.append((record.start, record.end))
+            applied.append(full_prompt_text)
+            completed_prompts.append(record.prompt)
+        if not applied:
+            return set()
+
+        temp_filename = f"{todo_path}.tmp"
+        with open(todo_path, 'rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            edits = []
+            for start, end in sorted(removed_ranges):
+                if edits and start <= edits[-1][1]:
+                    edits[-1] = (edits[-1][0], max(end, edits[-1][1]), b"")
+                else:
+                    edits.append((start, end, b""))
+            for i, (start, end, _) in enumerate(edits):
+                if not data[start:end].lstrip().startswith(b'---'):
+                    # The first block shares the '---' under the header, so drop the separator after it instead.
+                    separator_end = data.find(b'\n', end) + 1 or len(data)
+                    if data[end:separator_end].strip() == b'---': edits[i] = (start, separator_end, b"")
+
+            # --- Step 2: Add the new blocks right after the '---' under the Completed header ---
+            newline = "\r\n" if b"\r\n" in data[:4096] else "\n"
+            completed_blocks = [
+                f"\n### **[AUTO-COMPLETED]**\n- **Status:** Complete\n- **Task:**\n{prompt}\n\n---\n"
+                .replace("\n", newline).encode('utf-8') for prompt in completed_prompts]
+            kept_blocks = completed_blocks if keep_completed is None else completed_blocks[:keep_completed]
+            insert_position = todo_index.sections["completed"][1]
+            edits.append((insert_position, insert_position, b"".join(kept_blocks)))
+            print(f"  - Adding {len(applied)} completed task block(s) to the Completed section.")
+
+            with memoryview(data) as view:
+                # --- Step 3: Roll the oldest Completed entries, new ones included, into the archive ---
+                if keep_completed is not None:
+                    entries = [r for r in todo_index.records if r.section == "completed"
+                               and r.start >= insert_position and data[r.start:r.end].strip() not in (b"", b"---")]
+                    archived_new = completed_blocks[len(kept_blocks):]
+                    archived_old = entries[max(0, keep_completed - len(completed_blocks)):]
+                    old_entries_range = (0, 0)
+                    if archived_old:
+                        # Every entry but the first under the header starts with its '---' line; it goes with the entry.
+                        cut = archived_old[0].start
+                        line_end = data.find(b'\n', cut) + 1 or archived_old[0].end
+                        content_start = line_end if data[cut:line_end].strip() == b'---' else cut
+                        section_end = archived_old[-1].end
+                        old_entries_range = (content_start, section_end)
+                        if archived_old[0] is entries[0]:
+                            # Nothing older is kept, so the closing '---' after the last entry goes too
+                            # (the kept new blocks end with their own).
+                            line_end = data.find(b'\n', section_end) + 1 or len(data)
+                            if data[section_end:line_end].strip() == b'---': section_end = line_end
+                        edits.append((cut, section_end, b""))
+                    if archived_new or archived_old:
+                        archive_path = os.path.join(os.path.dirname(todo_path), TODO_ARCHIVE_FILENAME)
+                        with view[old_entries_range[0]:old_entries_range[1]] as old_entries:
+                            _append_to_archive(archive_path, archived_new + [old_entries], newline)
+                        print(f"  - Archived {len(archived_new) + len(archived_old)} completed block(s) "
+                              f"to {archive_path}.")
+
+                # --- Step 4: Splice the file and atomically replace it ---
+                with open(temp_filename, 'wb') as f:
+                    _write_ranges(f, view, edits)
+                    f.flush()
+                    os.fsync(f.fileno())
+        os.replace(temp_filename, todo_path)
+
+        print(f"  - Successfully updated and reorganized {todo_path}.")
+        return set(applied)
 
     except Exception as e:
         print(f"  - ERROR: An unexpected error occurred during file update: {e}")
-        return False
+        return set()
+
+def update_todo_for_completion(full_prompt_text: str, todo_path: str | None = None,
+                               keep_completed: int | None = None) -> bool:
+    """Moves a single task from Pending to Completed. See apply_todo_completions."""
+    return full_prompt_text in apply_todo_completions([full_prompt_text], todo_path, keep_completed)
 
-# --- The rest of the script is included below for completeness but is unchanged ---
 #==============================================================================
 # SECTION 0: GIT SYNCHRONIZATION
 #==============================================================================
+def worktree_todo_path() -> str:
+    return os.path.join(GIT_WORKTREE_DIR, TODO_FILENAME)
+
+def _git_worktree(*args: str, **kwargs) -> subprocess.CompletedProcess:
+    """Runs a git command inside the automation worktree, never in the user's checkout."""
+    return run_command(["git", "-C", GIT_WORKTREE_DIR, *args], capture_output=True, text=True, **kwargs)
+
+@timed_stage("sync")
 def sync_with_remote_and_prepare() -> bool:
+    """
+    Brings the automation worktree (GIT_WORKTREE_DIR) to the tip of the remote
+    main branch. The primary working tree is never stashed, checked out or
+    pulled, and the worktree is only touched when the fetch brought in new
+    commits or a previous run left edits behind.
+    """
     print("---")
     print("Step 0: Synchronizing with remote repository...")
+    remote_ref = f"{GIT_REMOTE_NAME}/{MAIN_BRANCH_NAME}"
     try:
-        status_result = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True)
-        if status_result.stdout:
-            print("  - Found uncommitted changes. Stashing them...")
-            subprocess.run(["git", "stash"], check=True)
-        print(f"  - Checking out '{MAIN_BRANCH_NAME}' branch...")
-        subprocess.run(["git", "checkout", MAIN_BRANCH_NAME], check=True, capture_output=True)
-        print(f"  - Pulling latest changes from '{GIT_REMOTE_NAME}/{MAIN_BRANCH_NAME}'...")
-        subprocess.run(["git", "pull", GIT_REMOTE_NAME, MAIN_BRANCH_NAME], check=True)
-        print("  - Synchronization successful. Local repository is up-to-date.")
+        print(f"  - Fetching '{remote_ref}'...")
+        run_command(["git", "fetch", GIT_REMOTE_NAME, MAIN_BRANCH_NAME], check=True, capture_output=True, text=True)
+        if not os.path.exists(os.path.join(GIT_WORKTREE_DIR, ".git")):
+            print(f"  - Creating automation worktree at '{GIT_WORKTREE_DIR}'...")
+            run_command(["git", "worktree", "prune"], check=True, capture_output=True, text=True)
+            run_command(["git", "worktree", "add", "--detach", GIT_WORKTREE_DIR, remote_ref],
+                           check=True, capture_output=True, text=True)
+        else:
+            local_head = _git_worktree("rev-parse", "HEAD", check=True).stdout.strip()
+            remote_head = _git_worktree("rev-parse", remote_ref, check=True).stdout.strip()
+            is_dirty = bool(_git_worktree("status", "--porcelain", check=True).stdout.strip())
+            if local_head == remote_head and not is_dirty:
+                print(f"  - Worktree is already at '{remote_ref}'. Skipping checkout.")
+            else:
+                print(f"  - Updating worktree to '{remote_ref}'...")
+                _git_worktree("checkout", "--force", "--detach", remote_ref, check=True)
+                _git_worktree("clean", "-fd", check=True)
+        print("  - Synchronization successful. Automation worktree is up-to-date.")
         print("---")
         return True
     except subprocess.CalledProcessError as e:
         print("\n  - FATAL ERROR: Git command failed during synchronization.")
         print(f"  - Error details: {e.stderr}")
-        subprocess.run(["git", "stash", "pop"])
+        METRICS.increment("sync_failed")
         return False
 
 #==============================================================================
 # SECTION 1: PARSING AND JULES INTERACTION
 #==============================================================================
+@timed_stage("parse")
+def parse_pending_records(filename: str) -> list[TaskRecord]:
+    """Returns every pending task with its role, assignee, goal and priority, in file order (see todo_parser)."""
+    return parse_pending_tasks(filename)
+
 def parse_structured_todo(filename: str) -> dict[str, str]:
-    prompts = {}
-    try:
-        with open(filename, "r", encoding="utf-8") as f: lines = f.readlines()
-    except FileNotFoundError: return {}
-    in_pending_section, is_capturing_task, current_task_lines = False, False, []
-    for line in lines:
-        stripped_line = line.strip()
-        if stripped_line.startswith('## **Pending Tasks**'): in_pending_section = True; continue
-        elif stripped_line.startswith('## **Completed Tasks**'): in_pending_section = False; continue
-        if not in_pending_section: continue
-        if stripped_line == '---':
-            if current_task_lines:
-                prompt = "\n".join(current_task_lines)
-                prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
-                prompts[prompt_hash] = prompt
-                current_task_lines = []
-            is_capturing_task = False; continue
-        if stripped_line == '- **Task:**': is_capturing_task = True; continue
-        if is_capturing_task and stripped_line: current_task_lines.append(stripped_line)
-    if current_task_lines:
-        prompt = "\n".join(current_task_lines)
-        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
-        prompts[prompt_hash] = prompt
-    return prompts
-
-def create_jules_task_with_cli(prompt: str) -> str | None:
+    """Returns prompt_hash -> prompt for every pending task (see todo_parser)."""
+    return {record.prompt_hash: record.prompt for record in parse_pending_records(filename)}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire()` blocks until a token is available,
+    so callers are throttled to `rate` calls per second with bursts of `burst`.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def parse_session_id(output: str) -> str | None:
+    for line in output.splitlines():
+        clean_line = line.strip().lower()
+        if clean_line.startswith("session id:") or clean_line.startswith("id:"):
+            return line.split(":")[-1].strip()
+    return None
+
+def create_jules_task_with_cli(prompt: str, rate_limiter: TokenBucket | None = None) -> str | None:
     print("---")
     print(f"-> Creating task for prompt:\n{prompt}\n")
-    try:
-        command = [JULES_EXECUTABLE_PATH, "remote", "new", "--repo", ".", "--session", prompt]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        session_id = None
-        for line in result.stdout.splitlines():
-            clean_line = line.strip().lower()
-            if clean_line.startswith("session id:") or clean_line.startswith("id:"):
-                session_id = line.split(":")[-1].strip()
-                break
+    command = [JULES_EXECUTABLE_PATH, "remote", "new", "--repo", ".", "--session", prompt]
+    first_line = prompt.splitlines()[0]
+    for attempt in range(1, CREATE_MAX_ATTEMPTS + 1):
+        if rate_limiter: rate_limiter.acquire()
+        try:
+            result = run_command(command, capture_output=True, text=True, check=True, timeout=CREATE_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            # The session may exist even though the CLI hung, so the caller checks the listing instead of retrying.
+            print(f"--> Creating task '{first_line}' timed out after {CREATE_TIMEOUT_SECONDS}s. Not retrying.")
+            METRICS.increment("create_timed_out")
+            raise
+        except subprocess.CalledProcessError as e:
+            # Non-zero exits are usually transient (network, auth refresh, throttling).
+            details = _error_details(e)
+            if attempt == CREATE_MAX_ATTEMPTS:
+                print(f"--> Failed to create task '{first_line}' after {attempt} attempts. Error: {details}")
+                METRICS.increment("create_failed")
+                return None
+            METRICS.increment("create_retried")
+            delay = CREATE_RETRY_BASE_DELAY * 2 ** (attempt - 1) + random.uniform(0, CREATE_RETRY_BASE_DELAY)
+            print(f"--> Attempt {attempt} for '{first_line}' failed ({details}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+        except Exception as e:
+            print(f"--> Failed to create task. Error: {e}")
+            METRICS.increment("create_failed")
+            return None
+        session_id = parse_session_id(result.stdout)
         if session_id:
             print(f"--> Success! Parsed Session ID: {session_id}")
             return session_id
         else:
-            print("--> Task created, but could not parse Session ID from output.")
+            print(f"--> Task '{first_line}' created, but could not parse Session ID from output.")
             print("--> Full output from CLI:")
             print(result.stdout)
             return None
-    except Exception as e:
-        print(f"--> Failed to create task. Error: {e}")
-        return None
+    return None
+
+@timed_stage("create")
+def create_jules_tasks_concurrently(tasks: dict[str, str], store: "TrackingStore") -> int:
+    """
+    Creates a session for every (prompt_hash -> prompt) item using a bounded
+    worker pool throttled by a token bucket. Each task is committed to the
+    tracking store as soon as its session ID is known, so a crash or Ctrl+C
+    part-way through never loses sessions already created; Ctrl+C also
+    cancels the creates still queued. A create that timed out is not retried
+    (the session may exist), but adopted from the remote listing if found.
+    Returns the number of sessions created or adopted.
+    """
+    rate_limiter = TokenBucket(CREATE_RATE_PER_SECOND, CREATE_RATE_BURST)
+    created_count = 0
+    timed_out = {}
+    pool = ThreadPoolExecutor(max_workers=CREATE_MAX_WORKERS)
+    futures = {}
+    try:
+        for prompt_hash, prompt in tasks.items():
+            # Journaled before the CLI can run, so a crash before add_task() is found by recover_journal().
+            entry_id = store.journal_begin("create", {"prompt_hash": prompt_hash, "prompt": prompt})
+            futures[pool.submit(create_jules_task_with_cli, prompt, rate_limiter)] = (prompt_hash, prompt, entry_id)
+        # Store writes stay on this thread; workers only run the CLI.
+        for future in as_completed(list(futures)):
+            created_count += _record_created_session(store, future, *futures.pop(future), timed_out)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Cancelling queued session creations and waiting for the ones already running...")
+        pool.shutdown(cancel_futures=True)
+        for future, (prompt_hash, prompt, entry_id) in futures.items():
+            if future.cancelled():
+                store.journal_finish(entry_id, TrackingStore.ABORTED)
+            else:
+                _record_created_session(store, future, prompt_hash, prompt, entry_id, timed_out)
+        # Timed-out creates stay open in the journal for recover_journal() on the next run.
+        raise
+    finally:
+        pool.shutdown()
+    if timed_out:
+        print(f"Checking the session listing for {len(timed_out)} timed-out creation(s)...")
+        created_count += _resolve_interrupted_creates(store, timed_out)
+    return created_count
+
+def _record_created_session(store: "TrackingStore", future, prompt_hash: str, prompt: str, entry_id: int,
+                            timed_out: dict[int, dict]) -> int:
+    """Stores one finished create and closes its journal entry; timed-out ones are collected in `timed_out`. Returns 1 if tracked."""
+    try:
+        session_id = future.result()
+    except subprocess.TimeoutExpired:
+        timed_out[entry_id] = {"prompt_hash": prompt_hash, "prompt": prompt}
+        return 0
+    if not session_id:
+        store.journal_finish(entry_id, TrackingStore.ABORTED)
+        return 0
+    store.add_task(prompt_hash, session_id, prompt)
+    store.journal_finish(entry_id)
+    METRICS.increment("created")
+    return 1
+
+PRIORITY_RANKS = {"critical": 0, "urgent": 0, "high": 1, "medium": 2, "normal": 2, "low": 3}
+
+def priority_rank(priority: str | None) -> int:
+    """Lower runs first. Accepts the names in PRIORITY_RANKS or a number ("1", "P1"); anything else is normal."""
+    if not priority: return PRIORITY_RANKS["normal"]
+    value = priority.strip().strip('*').lower()
+    if value in PRIORITY_RANKS: return PRIORITY_RANKS[value]
+    digits = value[1:] if value.startswith('p') else value
+    return int(digits) if digits.isdigit() else PRIORITY_RANKS["normal"]
+
+class TaskScheduler:
+    """
+    Decides which queued tasks may start a session now. At most `max_running`
+    sessions run at once, and each role at most its quota. Free slots are
+    handed out one at a time to the eligible role with the lowest share of
+    its quota in use (fair sharing); within a role, tasks go by priority and
+    then by their order in TODO.md. With SCHEDULER_LEND_IDLE_QUOTA, slots no
+    role can use within its quota go to roles past theirs, so the remote
+    limit stays saturated. Whatever is not selected stays queued until
+    running sessions complete.
+    """
+    def __init__(self, max_running: int | None = None, role_quotas: dict[str, int] | None = None,
+                 default_quota: int | None = None):
+        self.max_running = SCHEDULER_MAX_RUNNING if max_running is None else max_running
+        self.role_quotas = SCHEDULER_ROLE_QUOTAS if role_quotas is None else role_quotas
+        self.default_quota = SCHEDULER_DEFAULT_ROLE_QUOTA if default_quota is None else default_quota
 
-def get_all_jules_statuses() -> dict[str, str]:
+    @staticmethod
+    def role_of(record: TaskRecord | None) -> str:
+        return (record.role if record else None) or "Unassigned"
+
+    def quota(self, role: str) -> int:
+        return self.role_quotas.get(role, self.default_quota)
+
+    def select(self, queued: list[TaskRecord], running_roles: list[str]) -> list[TaskRecord]:
+        """`running_roles` has one entry per running session. Returns the tasks to start, in start order."""
+        running = {}
+        for role in running_roles: running[role] = running.get(role, 0) + 1
+        capacity = self.max_running - len(running_roles)
+        queues = {}
+        for position, record in enumerate(queued):
+            queues.setdefault(self.role_of(record), []).append((priority_rank(record.priority), position, record))
+        for queue in queues.values(): queue.sort(key=lambda item: item[:2], reverse=True)  # Pop from the end.
+        selected = []
+        while capacity > 0:
+            eligible = [role for role, queue in queues.items() if queue and running.get(role, 0) < self.quota(role)]
+            if not eligible and SCHEDULER_LEND_IDLE_QUOTA:
+                eligible = [role for role, queue in queues.items() if queue]
+            if not eligible: break
+            role = min(eligible, key=lambda r: (running.get(r, 0) / max(self.quota(r), 1), queues[r][-1][:2]))
+            selected.append(queues[role].pop()[2])
+            running[role] = running.get(role, 0) + 1
+            capacity -= 1
+        return selected
+
+COMPLETE_STATUSES = ('COMPLETE', 'COMPLETED')
+
+def _parse_status_line(line: str) -> tuple[str, str] | None:
+    words = line.split()
+    if len(words) < 2: return None
+    truncated_id = words[0]
+    status = words[-1]
+    if truncated_id.endswith('…'):
+        truncated_id = truncated_id[:-1]
+    return truncated_id, status
+
+def _tracked_ids_with_prefix(sorted_ids: list[str], prefix: str) -> list[str]:
+    """Returns every ID in `sorted_ids` that starts with `prefix`; they are contiguous in sort order."""
+    matches = []
+    for i in range(bisect.bisect_left(sorted_ids, prefix), len(sorted_ids)):
+        if not sorted_ids[i].startswith(prefix): break
+        matches.append(sorted_ids[i])
+    return matches
+
+def _stream_session_listing():
+    """
+    Yields the data lines of `jules remote list --session` as the CLI prints
+    them, read through a pipe rather than buffered. Closing the generator
+    early (see contextlib.closing) terminates the CLI. Raises
+    CalledProcessError if the CLI fails before the listing was consumed.
+    """
+    command = [JULES_EXECUTABLE_PATH, "remote", "list", "--session"]
+    started = time.perf_counter()
+    completed = False
+    stopped_early = False
+    try:
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as stderr_file, \
+                subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file,
+                                 text=True, encoding="utf-8", errors="replace") as process:
+            try:
+                seen_header = False
+                for line in process.stdout:
+                    if not seen_header:
+                        seen_header = bool(line.strip())  # The first non-blank line is the column header.
+                        continue
+                    yield line
+            finally:
+                if process.poll() is None and not process.stdout.closed:
+                    stopped_early = True
+                    process.terminate()
+            return_code = process.wait()
+            if return_code != 0 and not stopped_early:
+                stderr_file.seek(0)
+                raise subprocess.CalledProcessError(return_code, command, stderr=stderr_file.read())
+            completed = True
+    finally:
+        METRICS.observe_command(_command_key(command), time.perf_counter() - started,
+                                failed=not (completed or stopped_early))
+
+@timed_stage("status_fetch")
+def get_all_jules_statuses(tracked_session_ids: list[str] | None = None) -> list[tuple[str, str]] | None:
+    """
+    Streams `jules remote list --session` and returns (truncated_session_id,
+    status) rows in listing order. Rows are kept as a list rather than a dict
+    so that two sessions whose IDs are truncated to the same prefix are both
+    visible to the caller.
+
+    When `tracked_session_ids` is given, only rows belonging to those
+    sessions are kept and the CLI is stopped as soon as every one of them has
+    been seen, so the cost scales with the tracked sessions rather than the
+    account's history. A colliding row listed after that point is not seen.
+    Returns None when the listing could not be read.
+    """
     print("  - Fetching status of all remote sessions...")
-    statuses = {}
+    statuses = []
+    tracked_ids = sorted(set(tracked_session_ids)) if tracked_session_ids is not None else None
+    if tracked_ids is not None and not tracked_ids: return statuses
+    unresolved_ids = set(tracked_ids or ())
+    lines_read = 0
+    stopped_early = False
     try:
-        command = [JULES_EXECUTABLE_PATH, "remote", "list", "--session"]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        lines = result.stdout.strip().splitlines()
-        for line in lines[1:]:
-            words = line.split()
-            if len(words) < 2: continue
-            truncated_id = words[0]
-            status = words[-1]
-            if truncated_id.endswith('…'):
-                truncated_id = truncated_id[:-1]
-            statuses[truncated_id] = status
+        with contextlib.closing(_stream_session_listing()) as lines:
+            for line in lines:
+                lines_read += 1
+                row = _parse_status_line(line)
+                if row is None: continue
+                if tracked_ids is None:
+                    statuses.append(row)
+                    continue
+                matched_ids = _tracked_ids_with_prefix(tracked_ids, row[0])
+                if not matched_ids: continue
+                statuses.append(row)
+                unresolved_ids.difference_update(matched_ids)
+                if not unresolved_ids:
+                    stopped_early = True
+                    break
+        if stopped_early:
+            print(f"  - All {len(tracked_ids)} tracked sessions resolved after {lines_read} rows; stopped the listing early.")
         print(f"  - Successfully parsed {len(statuses)} session statuses.")
         return statuses
     except Exception as e:
-        print(f"  - WARNING: Could not retrieve or parse session statuses. Error: {e}")
-        return {}
+        details = _error_details(e)
+        print(f"  - WARNING: Could not retrieve or parse session statuses. Error: {details}")
+        return None
+
+_LISTING_COLUMNS = re.compile(r"\s{2,}")
+
+def get_existing_jules_sessions(page_size: int = SYNC_PAGE_SIZE):
+    """
+    Pages through the streamed `jules remote list --session` output, yielding
+    lists of up to `page_size` (truncated_session_id, description, status)
+    tuples. Columns are separated by runs of two or more spaces; the
+    description keeps any truncation ellipsis, which normalize_task_line drops.
+    """
+    page = []
+    with contextlib.closing(_stream_session_listing()) as lines:
+        for line in lines:
+            columns = _LISTING_COLUMNS.split(line.strip())
+            if len(columns) < 3: continue
+            truncated_id = columns[0][:-1] if columns[0].endswith('…') else columns[0]
+            page.append((truncated_id, columns[1], columns[-1]))
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+class PrefixIndex:
+    """
+    Character trie over (key, value) pairs where keys may be truncated.
+    `matches(text)` returns the values of every key that is a prefix of
+    `text`, walking at most len(text) nodes no matter how many keys exist.
+    """
+    _VALUES = ""  # Never a real edge label, since edges are single characters.
+
+    def __init__(self, items=()):
+        self.root = {}
+        for key, value in items: self.add(key, value)
+
+    def add(self, key: str, value):
+        if not key: return  # An empty key would be a prefix of everything.
+        node = self.root
+        for char in key: node = node.setdefault(char, {})
+        node.setdefault(self._VALUES, []).append(value)
+
+    def matches(self, text: str) -> list:
+        found = []
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None: break
+            found.extend(node.get(self._VALUES, ()))
+        return found
+
+    def related(self, text: str) -> list:
+        """
+        Like matches(), plus the values of every key that `text` is itself a
+        prefix of (keys that run past the end of `text`).
+        """
+        found = []
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None: return found
+            found.extend(node.get(self._VALUES, ()))
+        stack = [child for edge, child in node.items() if edge != self._VALUES]
+        while stack:
+            child = stack.pop()
+            for edge, value in child.items():
+                if edge == self._VALUES: found.extend(value)
+                else: stack.append(value)
+        return found
+
+class StatusCache:
+    """
+    Reuses the last successful `jules remote list` result for `ttl` seconds,
+    as long as it was fetched for (at least) the sessions now being asked for.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.rows = []
+        self.fetched_at = None
+        self.fetched_for = frozenset()
+
+    def get(self, tracked_session_ids: list[str]) -> list[tuple[str, str]] | None:
+        is_fresh = self.fetched_at is not None and time.monotonic() - self.fetched_at <= self.ttl
+        if is_fresh and self.fetched_for.issuperset(tracked_session_ids):
+            print(f"  - Reusing session statuses fetched {time.monotonic() - self.fetched_at:.0f}s ago.")
+            return self.rows
+        rows = get_all_jules_statuses(tracked_session_ids)
+        if rows:
+            self.rows = rows
+            self.fetched_at = time.monotonic()
+            self.fetched_for = frozenset(tracked_session_ids)
+        return rows
+
+def build_status_index(all_statuses: list[tuple[str, str]]) -> "PrefixIndex":
+    return PrefixIndex((truncated_id, (truncated_id, status)) for truncated_id, status in all_statuses)
+
+def resolve_session_status(status_index: PrefixIndex, full_session_id: str) -> str:
+    """
+    Looks up a tracked session in an index of (truncated_id, status) rows.
+    Returns the status, "NOT FOUND", or "AMBIGUOUS" when more than one remote
+    session's truncated ID is a prefix of `full_session_id`.
+    """
+    candidates = status_index.matches(full_session_id)
+    if not candidates: return "NOT FOUND"
+    if len(candidates) > 1:
+        listed = ", ".join(f"{truncated_id}… ({status})" for truncated_id, status in candidates)
+        print(f"  - WARNING: Session {full_session_id} matches {len(candidates)} remote sessions: {listed}")
+        METRICS.increment("status_ambiguous")
+        return "AMBIGUOUS"
+    return candidates[0][1]
 
 #==============================================================================
 # SECTION 2: FILE AND GIT MANIPULATION
 #==============================================================================
-def create_pull_request(session_id: str, prompt_hash: str):
-    print("  - Starting Git process to create a Pull Request...")
-    branch_name = f"docs/complete-task-{session_id}"
-    commit_message = f"docs: Mark task as complete\n\nAssociated Jules Session: {session_id}"
+@timed_stage("pr")
+def _commit_push_and_open_pr(branch_name: str, commit_message: str, pr_title: str, pr_body: str) -> bool:
+    """
+    Commits the worktree's TODO.md (and its archive) on a new branch, pushes it and opens a PR.
+    The worktree is returned to the remote main branch afterwards; the local
+    branch is deleted since only the pushed copy is needed.
+    Returns True if the PR was opened.
+    """
     try:
-        subprocess.run(["git", "checkout", "-b", branch_name], check=True)
-        subprocess.run(["git", "add", TODO_FILENAME], check=True)
-        subprocess.run(["git", "commit", "-m", commit_message], check=True)
+        _git_worktree("checkout", "-b", branch_name, check=True)
+        _git_worktree("add", TODO_FILENAME, check=True)
+        if os.path.exists(os.path.join(GIT_WORKTREE_DIR, TODO_ARCHIVE_FILENAME)):
+            _git_worktree("add", TODO_ARCHIVE_FILENAME, check=True)
+        _git_worktree("commit", "-m", commit_message, check=True)
         print(f"  - Pushing branch '{branch_name}' to remote...")
-        subprocess.run(["git", "push", GIT_REMOTE_NAME, branch_name], check=True)
+        _git_worktree("push", GIT_REMOTE_NAME, branch_name, check=True)
         print("  - Creating Pull Request on GitHub...")
-        pr_title = f"Docs: Mark task {session_id} as complete"
-        pr_body = f"This PR automatically updates `TODO.md` after verifying that Jules session `{session_id}` is complete."
-        subprocess.run(["gh", "pr", "create", "--title", pr_title, "--body", pr_body], check=True)
+        run_command(["gh", "pr", "create", "--head", branch_name, "--base", MAIN_BRANCH_NAME,
+                        "--title", pr_title, "--body", pr_body], check=True, cwd=GIT_WORKTREE_DIR)
         print("  - Successfully created Pull Request!")
+        METRICS.increment("prs_opened")
+        return True
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"  - GIT/GH ERROR: An error occurred: {e}")
-        print("  - Cleaning up local branch...")
-        subprocess.run(["git", "checkout", MAIN_BRANCH_NAME])
-        subprocess.run(["git", "branch", "-D", branch_name])
+        details = _error_details(e)
+        print(f"  - GIT/GH ERROR: An error occurred: {details}")
+        METRICS.increment("prs_failed")
+        return False
     finally:
-        subprocess.run(["git", "checkout", MAIN_BRANCH_NAME])
+        print("  - Cleaning up local branch...")
+        _git_worktree("checkout", "--force", "--detach", f"{GIT_REMOTE_NAME}/{MAIN_BRANCH_NAME}")
+        _git_worktree("branch", "-D", branch_name)
+
+def pull_request_branch(session_id: str | None = None) -> str:
+    """Branch name for one session's completion PR, or for a batch PR when `session_id` is None."""
+    if session_id: return f"docs/complete-task-{session_id}"
+    return f"docs/complete-tasks-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}"
+
+def _single_pull_request_text(session_id: str) -> tuple[str, str, str]:
+    commit_message = f"docs: Mark task as complete\n\nAssociated Jules Session: {session_id}"
+    pr_title = f"Docs: Mark task {session_id} as complete"
+    pr_body = f"This PR automatically updates `TODO.md` after verifying that Jules session `{session_id}` is complete."
+    return commit_message, pr_title, pr_body
+
+def _batch_pull_request_text(completions: list[tuple[str, str]]) -> tuple[str, str, str]:
+    session_lines = "\n".join(f"Associated Jules Session: {session_id}" for session_id, _ in completions)
+    commit_message = f"docs: Mark {len(completions)} task(s) as complete\n\n{session_lines}"
+    pr_title = f"Docs: Mark {len(completions)} task(s) as complete"
+    task_lines = "\n".join(f"- `{session_id}`: {prompt.splitlines()[0]}" for session_id, prompt in completions)
+    pr_body = ("This PR automatically updates `TODO.md` after verifying that the following Jules sessions "
+               f"are complete:\n\n{task_lines}")
+    return commit_message, pr_title, pr_body
+
+def create_pull_request(session_id: str, prompt_hash: str) -> bool:
+    print("  - Starting Git process to create a Pull Request...")
+    return _commit_push_and_open_pr(pull_request_branch(session_id), *_single_pull_request_text(session_id))
+
+def create_batch_pull_request(completions: list[tuple[str, str]], branch_name: str | None = None) -> bool:
+    """
+    Opens a single PR for every (session_id, prompt) completed in this review
+    run. Expects all of their TODO.md edits to be in the working tree already.
+    """
+    print(f"  - Starting Git process to create one Pull Request for {len(completions)} completed task(s)...")
+    return _commit_push_and_open_pr(branch_name or pull_request_branch(), *_batch_pull_request_text(completions))
+
+def remote_branch_exists(branch_name: str) -> bool:
+    result = _git_worktree("ls-remote", "--exit-code", "--heads", GIT_REMOTE_NAME, branch_name)
+    return result.returncode == 0
+
+@timed_stage("pr")
+def reopen_pull_request(branch_name: str, pr_title: str, pr_body: str) -> bool:
+    """
+    Opens the PR for a branch that an interrupted run already pushed. An
+    "already exists" error from `gh` means the earlier run got that far too.
+    """
+    result = run_command(["gh", "pr", "create", "--head", branch_name, "--base", MAIN_BRANCH_NAME,
+                          "--title", pr_title, "--body", pr_body],
+                         capture_output=True, text=True, cwd=GIT_WORKTREE_DIR)
+    if result.returncode == 0 or "already exists" in (result.stderr or ""):
+        print(f"  - Pull Request for '{branch_name}' is open.")
+        return True
+    print(f"  - GIT/GH ERROR: Could not open a Pull Request for '{branch_name}': {(result.stderr or '').strip()}")
+    return False
+
+#==============================================================================
+# SECTION 3: TRACKING STORE
+#==============================================================================
+class TrackingStore:
+    """
+    SQLite (WAL mode) record of every task handed to Jules. Each task row has
+    a local lifecycle `status` (ACTIVE until its completion workflow has run,
+    then DONE) and the last `remote_status` reported by the CLI; every change
+    to either is appended to `status_history`. All writes are single-task
+    transactions, so an interrupted run keeps everything committed before it.
+    """
+    ACTIVE = "ACTIVE"
+    DONE = "DONE"
+    # Journal entry states. An entry still OPEN at startup belongs to an interrupted run.
+    OPEN = "OPEN"
+    FINISHED = "FINISHED"
+    ABORTED = "ABORTED"
+
+    def __init__(self, path: str = TRACKING_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    prompt_hash   TEXT PRIMARY KEY,
+                    session_id    TEXT NOT NULL,
+                    prompt        TEXT NOT NULL,
+                    status        TEXT NOT NULL,
+                    remote_status TEXT,
+                    created_at    TEXT NOT NULL,
+                    updated_at    TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_session_id ON tasks(session_id);
+                CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+                CREATE TABLE IF NOT EXISTS status_history (
+                    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prompt_hash   TEXT NOT NULL,
+                    status        TEXT NOT NULL,
+                    remote_status TEXT,
+                    changed_at    TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_prompt_hash ON status_history(prompt_hash);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key   TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS journal (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    operation   TEXT NOT NULL,
+                    step        TEXT NOT NULL,
+                    state       TEXT NOT NULL,
+                    payload     TEXT NOT NULL,
+                    started_at  TEXT NOT NULL,
+                    updated_at  TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_journal_state ON journal(state);
+            """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def tracked_session_ids(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT session_id FROM tasks")}
+
+    def tracked_hashes(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT prompt_hash FROM tasks")}
+
+    def active_tasks(self) -> list[tuple[str, str]]:
+        """Returns (prompt_hash, session_id) for every ACTIVE task; prompts are loaded on demand."""
+        return self.conn.execute(
+            "SELECT prompt_hash, session_id FROM tasks WHERE status = ? ORDER BY created_at",
+            (self.ACTIVE,)).fetchall()
+
+    def active_remote_statuses(self) -> dict[str, str]:
+        """Returns prompt_hash -> last known remote status for every ACTIVE task that has one."""
+        return dict(self.conn.execute(
+            "SELECT prompt_hash, remote_status FROM tasks WHERE status = ? AND remote_status IS NOT NULL",
+            (self.ACTIVE,)))
+
+    def running_tasks(self) -> list[tuple[str, str]]:
+        """
+        Returns (prompt_hash, session_id) for ACTIVE tasks whose session is in
+        flight: last seen in one of SCHEDULER_RUNNING_STATUSES, or not seen at
+        all yet. Completed, failed and vanished ("NOT FOUND") sessions hold no slot.
+        """
+        placeholders = ", ".join("?" * len(SCHEDULER_RUNNING_STATUSES))
+        return self.conn.execute(
+            "SELECT prompt_hash, session_id FROM tasks WHERE status = ? "
+            f"AND (remote_status IS NULL OR remote_status IN ({placeholders}))",
+            (self.ACTIVE, *SCHEDULER_RUNNING_STATUSES)).fetchall()
+
+    def active_task_details(self) -> list[dict]:
+        """Every ACTIVE task with its session, last remote status and first prompt line, oldest first."""
+        rows = self.conn.execute(
+            "SELECT prompt_hash, session_id, remote_status, updated_at, prompt FROM tasks WHERE status = ? "
+            "ORDER BY created_at", (self.ACTIVE,))
+        return [{"prompt_hash": prompt_hash, "session_id": session_id, "remote_status": remote_status,
+                 "updated_at": updated_at, "task": prompt.splitlines()[0] if prompt else ""}
+                for prompt_hash, session_id, remote_status, updated_at, prompt in rows]
+
+    def count_active(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (self.ACTIVE,)).fetchone()[0]
+
+    def get_prompt(self, prompt_hash: str) -> str | None:
+        row = self.conn.execute("SELECT prompt FROM tasks WHERE prompt_hash = ?", (prompt_hash,)).fetchone()
+        return row[0] if row else None
+
+    def add_task(self, prompt_hash: str, session_id: str, prompt: str) -> bool:
+        """Starts tracking a task. Returns False if the prompt hash was already tracked."""
+        now = self._now()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO tasks (prompt_hash, session_id, prompt, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (prompt_hash, session_id, prompt, self.ACTIVE, now, now))
+            if cursor.rowcount == 0: return False
+            self.conn.execute(
+                "INSERT INTO status_history (prompt_hash, status, changed_at) VALUES (?, ?, ?)",
+                (prompt_hash, self.ACTIVE, now))
+        return True
+
+    def set_remote_status(self, prompt_hash: str, remote_status: str):
+        self._update(prompt_hash, remote_status=remote_status)
+
+    def mark_done(self, prompt_hash: str):
+        self._update(prompt_hash, status=self.DONE)
+
+    def _update(self, prompt_hash: str, status: str | None = None, remote_status: str | None = None):
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT status, remote_status FROM tasks WHERE prompt_hash = ?", (prompt_hash,)).fetchone()
+            if not row: return
+            new_status = status or row[0]
+            new_remote_status = remote_status or row[1]
+            if (new_status, new_remote_status) == tuple(row): return
+            now = self._now()
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, remote_status = ?, updated_at = ? WHERE prompt_hash = ?",
+                (new_status, new_remote_status, now, prompt_hash))
+            self.conn.execute(
+                "INSERT INTO status_history (prompt_hash, status, remote_status, changed_at) VALUES (?, ?, ?, ?)",
+                (prompt_hash, new_status, new_remote_status, now))
+
+    def journal_begin(self, operation: str, payload: dict, step: str = "started") -> int:
+        """Records an operation before it runs. Returns the journal entry ID."""
+        now = self._now()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO journal (operation, step, state, payload, started_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (operation, step, self.OPEN, json.dumps(payload), now, now))
+        return cursor.lastrowid
+
+    def journal_step(self, entry_id: int, step: str, payload: dict | None = None):
+        """Records that an open operation got past `step` (optionally replacing its payload)."""
+        with self.conn:
+            if payload is None:
+                self.conn.execute("UPDATE journal SET step = ?, updated_at = ? WHERE id = ?",
+                                  (step, self._now(), entry_id))
+            else:
+                self.conn.execute("UPDATE journal SET step = ?, payload = ?, updated_at = ? WHERE id = ?",
+                                  (step, json.dumps(payload), self._now(), entry_id))
+
+    def journal_finish(self, entry_id: int, state: str = FINISHED):
+        with self.conn:
+            self.conn.execute("UPDATE journal SET state = ?, updated_at = ? WHERE id = ?",
+                              (state, self._now(), entry_id))
+
+    def open_journal_entries(self) -> list[tuple[int, str, str, dict]]:
+        """Returns (id, operation, step, payload) for every entry an interrupted run left OPEN, oldest first."""
+        rows = self.conn.execute(
+            "SELECT id, operation, step, payload FROM journal WHERE state = ? ORDER BY id", (self.OPEN,))
+        return [(entry_id, operation, step, json.loads(payload)) for entry_id, operation, step, payload in rows]
+
+    def _rekey(self, old_hash: str, new_hash: str, prompt: str | None = None):
+        """Moves a task and its history to a new prompt hash. Call inside a transaction."""
+        if prompt is None:
+            self.conn.execute("UPDATE tasks SET prompt_hash = ?, updated_at = ? WHERE prompt_hash = ?",
+                              (new_hash, self._now(), old_hash))
+        else:
+            self.conn.execute("UPDATE tasks SET prompt_hash = ?, prompt = ?, updated_at = ? WHERE prompt_hash = ?",
+                              (new_hash, prompt, self._now(), old_hash))
+        self.conn.execute("UPDATE status_history SET prompt_hash = ? WHERE prompt_hash = ?", (new_hash, old_hash))
+
+    def update_prompt(self, old_hash: str, new_hash: str, prompt: str):
+        """Points a tracked task (and its session) at the edited text of its TODO.md block."""
+        with self.conn:
+            self._rekey(old_hash, new_hash, prompt)
+
+    def rehash_prompts(self, hash_function) -> tuple[int, int]:
+        """
+        Recomputes every task's prompt hash with `hash_function`, also in the
+        history and in open journal entries. A task whose new hash is already
+        taken (a duplicate under the new identity) keeps its old hash.
+        Returns (rehashed, duplicates).
+        """
+        rehashed = duplicates = 0
+        renamed = {}
+        with self.conn:
+            taken = self.tracked_hashes()
+            for old_hash, prompt in self.conn.execute("SELECT prompt_hash, prompt FROM tasks").fetchall():
+                new_hash = hash_function(prompt)
+                if new_hash == old_hash: continue
+                if new_hash in taken:
+                    duplicates += 1
+                    continue
+                self._rekey(old_hash, new_hash)
+                taken.discard(old_hash)
+                taken.add(new_hash)
+                renamed[old_hash] = new_hash
+                rehashed += 1
+            for entry_id, _, _, payload in self.open_journal_entries():
+                if "prompt" in payload: payload["prompt_hash"] = hash_function(payload["prompt"])
+                for task in payload.get("tasks", ()): task[0] = renamed.get(task[0], task[0])
+                self.conn.execute("UPDATE journal SET payload = ? WHERE id = ?", (json.dumps(payload), entry_id))
+        return rehashed, duplicates
+
+    def import_csv(self, path: str) -> int:
+        """Imports rows of the legacy `prompt_hash,session_id,prompt` CSV. Returns rows added."""
+        imported = 0
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3: continue
+                if self.add_task(row[0], row[1], row[2]): imported += 1
+        return imported
+
+def open_tracking_store() -> TrackingStore:
+    """Opens the tracking store, importing the legacy CSV file the first time."""
+    store = TrackingStore()
+    if os.path.exists(TRACKING_FILE) and not store.get_meta("csv_imported"):
+        imported = store.import_csv(TRACKING_FILE)
+        store.set_meta("csv_imported", store._now())
+        print(f"  - Imported {imported} tasks from legacy '{TRACKING_FILE}' into '{TRACKING_DB}'.")
+    if store.get_meta("prompt_identity") != PROMPT_IDENTITY_VERSION:
+        rehashed, duplicates = store.rehash_prompts(hash_prompt)
+        store.set_meta("prompt_identity", PROMPT_IDENTITY_VERSION)
+        if rehashed or duplicates:
+            print(f"  - Re-keyed {rehashed} tracked tasks to normalized prompt identities "
+                  f"({duplicates} duplicates kept their old key).")
+    return store
 
 #==============================================================================
-# SECTION 3: MAIN WORKFLOWS
+# SECTION 4: MAIN WORKFLOWS
 #==============================================================================
 def run_sync_mode():
     print("Running in SYNC mode...")
     if not sync_with_remote_and_prepare(): return
-    # ... (rest of sync mode is unchanged)
-    tasks_in_todo = parse_structured_todo(TODO_FILENAME)
-    if not tasks_in_todo: print("No pending tasks found in TODO.md."); return
-    tracked_tasks = {}
-    if os.path.exists(TRACKING_FILE):
-        with open(TRACKING_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader: tracked_tasks[row[0]] = row[1]
-    untracked_tasks = {h: p for h, p in tasks_in_todo.items() if h not in tracked_tasks}
-    if not untracked_tasks:
-        print("All pending tasks in TODO.md are already being tracked.")
-        return
+    pending_records = parse_pending_records(worktree_todo_path())
+    if not pending_records: print("No pending tasks found in TODO.md."); return
+    with open_tracking_store() as store:
+        reconcile_edited_tasks(pending_records, store)
+        tracked_hashes = store.tracked_hashes()
+        untracked_tasks = {r.prompt_hash: r.prompt for r in pending_records if r.prompt_hash not in tracked_hashes}
+        if not untracked_tasks:
+            print("All pending tasks in TODO.md are already being tracked.")
+            return
+        adopt_existing_sessions(untracked_tasks, store)
+
+@timed_stage("adopt")
+def adopt_existing_sessions(untracked_tasks: dict[str, str], store: TrackingStore):
+    """
+    Adopts remote sessions that were started outside this script. Session
+    descriptions (the truncated first line of their prompt) are loaded page by
+    page into a PrefixIndex on their normalized text, then each untracked
+    task's normalized first line is looked up in O(len(line)). A task that
+    matches several sessions, or a session claimed by several tasks, is
+    reported and left for a human to resolve.
+    """
     print(f"Found {len(untracked_tasks)} untracked tasks in TODO.md. Checking for existing sessions...")
-    existing_sessions = get_existing_jules_sessions()
-    if not existing_sessions:
+    tracked_session_ids = sorted(store.tracked_session_ids())
+    description_index = PrefixIndex()
+    session_count = 0
+    try:
+        for page in get_existing_jules_sessions():
+            for truncated_id, description, status in page:
+                session_count += 1
+                if _tracked_ids_with_prefix(tracked_session_ids, truncated_id): continue
+                key = normalize_task_line(description)
+                if len(key) >= SYNC_MIN_MATCH_CHARS:
+                    description_index.add(key, (truncated_id, description, status))
+    except (subprocess.CalledProcessError, OSError) as e:
+        details = _error_details(e)
+        print(f"  - ERROR: Could not list existing sessions. Error: {details}")
+        return
+    if not session_count:
         print("No existing remote sessions found to sync with.")
         return
-    adopted_tasks = []
+    print(f"  - Indexed {session_count} remote sessions.")
+
+    candidates_by_task = {}
+    claims_by_session = {}
     for prompt_hash, full_prompt in untracked_tasks.items():
         first_line_of_prompt = full_prompt.splitlines()[0]
-        for desc, session_id in existing_sessions.items():
-            if first_line_of_prompt.startswith(desc.replace('…','')):
-                print(f"  - MATCH FOUND! Adopting session '{session_id}' for task: '{first_line_of_prompt}'")
-                adopted_tasks.append([prompt_hash, session_id, full_prompt])
-                break
+        key = normalize_task_line(first_line_of_prompt)
+        if len(key) < SYNC_MIN_MATCH_CHARS: continue
+        candidates = {session[0]: session for session in description_index.related(key)}
+        if not candidates: continue
+        if len(candidates) > 1:
+            listed = ", ".join(f"'{session_id}…' ({description})" for session_id, description, _ in candidates.values())
+            print(f"  - AMBIGUOUS: Task '{first_line_of_prompt}' matches {len(candidates)} sessions: {listed}. Not adopting.")
+            METRICS.increment("adopt_ambiguous")
+            continue
+        session = next(iter(candidates.values()))
+        candidates_by_task[prompt_hash] = session
+        claims_by_session.setdefault(session[0], []).append(prompt_hash)
+
+    adopted_tasks = []
+    for prompt_hash, (truncated_id, description, status) in candidates_by_task.items():
+        full_prompt = untracked_tasks[prompt_hash]
+        first_line_of_prompt = full_prompt.splitlines()[0]
+        if len(claims_by_session[truncated_id]) > 1:
+            print(f"  - AMBIGUOUS: Session '{truncated_id}…' ({description}) matches "
+                  f"{len(claims_by_session[truncated_id])} tasks, including '{first_line_of_prompt}'. Not adopting.")
+            METRICS.increment("adopt_ambiguous")
+            continue
+        print(f"  - MATCH FOUND! Adopting session '{truncated_id}' for task: '{first_line_of_prompt}'")
+        if store.add_task(prompt_hash, truncated_id, full_prompt):
+            store.set_remote_status(prompt_hash, status)
+            METRICS.increment("adopted")
+            adopted_tasks.append(truncated_id)
     if adopted_tasks:
-        with open(TRACKING_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerows(adopted_tasks)
         print(f"\nSuccessfully adopted and tracked {len(adopted_tasks)} existing sessions.")
     else:
         print("\nFound no existing sessions that match untracked tasks.")
 
+@timed_stage("reconcile")
+def reconcile_edited_tasks(pending_records: list[TaskRecord], store: TrackingStore) -> int:
+    """
+    Finds untracked pending tasks that are edits of an ACTIVE tracked task
+    whose own text is no longer in TODO.md, and re-points the tracked task
+    (and its session) at the new text instead of letting it count as new
+    work. Pairs are taken most-similar first, each side at most once; a tie
+    for the best match is reported and left alone.
+    Returns the number of tasks updated.
+    """
+    pending_hashes = {record.prompt_hash for record in pending_records}
+    orphaned = [(prompt_hash, session_id) for prompt_hash, session_id in store.active_tasks()
+                if prompt_hash not in pending_hashes]
+    if not orphaned: return 0
+    tracked_hashes = store.tracked_hashes()
+    untracked = [record for record in pending_records if record.prompt_hash not in tracked_hashes]
+    if not untracked: return 0
+
+    similarity_index = PromptSimilarityIndex()
+    for prompt_hash, _ in orphaned:
+        similarity_index.add(prompt_hash, store.get_prompt(prompt_hash) or "")
+    candidates = []
+    for position, record in enumerate(untracked):
+        matches = similarity_index.similar(record.prompt, PROMPT_SIMILARITY_THRESHOLD)
+        if len(matches) > 1 and matches[0][1] == matches[1][1]:
+            print(f"  - AMBIGUOUS: Task '{record.prompt.splitlines()[0]}' is equally similar to "
+                  f"{sum(score == matches[0][1] for _, score in matches)} tracked tasks. Treating it as new.")
+            continue
+        candidates += [(score, position, old_hash) for old_hash, score in matches]
+
+    session_ids = dict(orphaned)
+    claimed_records, claimed_tasks = set(), set()
+    updated = 0
+    for score, position, old_hash in sorted(candidates, key=lambda candidate: (-candidate[0], candidate[1])):
+        if position in claimed_records or old_hash in claimed_tasks: continue
+        claimed_records.add(position)
+        claimed_tasks.add(old_hash)
+        record = untracked[position]
+        store.update_prompt(old_hash, record.prompt_hash, record.prompt)
+        print(f"  - Task '{record.prompt.splitlines()[0]}' was edited in {TODO_FILENAME} ({score:.0%} similar); "
+              f"session {session_ids[old_hash]} now tracks the new text.")
+        updated += 1
+    METRICS.increment("edits_reconciled", updated)
+    return updated
+
+def refresh_running_statuses(store: TrackingStore):
+    """
+    Records the current remote status of every session the store still counts
+    as running. A session missing from a successful listing is recorded as
+    "NOT FOUND", so a deleted session stops holding a scheduler slot.
+    """
+    running = store.running_tasks()
+    if not running: return
+    all_statuses = get_all_jules_statuses([session_id for _, session_id in running])
+    if all_statuses is None: return
+    status_index = build_status_index(all_statuses)
+    for prompt_hash, session_id in running:
+        found_status = resolve_session_status(status_index, session_id)
+        if found_status != "AMBIGUOUS":
+            store.set_remote_status(prompt_hash, found_status)
+
+def create_untracked_tasks(pending_records: list[TaskRecord], store: TrackingStore, refresh_statuses: bool = True,
+                           scheduler: TaskScheduler | None = None):
+    """
+    Starts sessions for the untracked pending tasks that the scheduler admits
+    now; the rest stay queued in TODO.md for a later run or watch cycle.
+    With `refresh_statuses`, remote statuses are re-fetched first when the
+    stored ones leave too little capacity (watch mode keeps them current).
+    """
+    scheduler = scheduler or TaskScheduler()
+    tracked_hashes = store.tracked_hashes()
+    queued = list({record.prompt_hash: record for record in pending_records
+                   if record.prompt_hash not in tracked_hashes}.values())
+    if not queued: print("All pending tasks in TODO.md are already being tracked."); return
+    if refresh_statuses and len(store.running_tasks()) + len(queued) > scheduler.max_running:
+        refresh_running_statuses(store)
+    roles_by_hash = {record.prompt_hash: scheduler.role_of(record) for record in pending_records}
+    running_roles = [roles_by_hash.get(prompt_hash, scheduler.role_of(None)) for prompt_hash, _ in store.running_tasks()]
+    selected = scheduler.select(queued, running_roles)
+    if SESSION_BUDGET is not None:
+        granted = SESSION_BUDGET.reserve(len(selected))
+        if granted < len(selected):
+            print(f"Session cap reached: creating {granted} of {len(selected)} scheduled tasks; "
+                  "the rest wait for a later run.")
+            METRICS.increment("create_deferred", len(selected) - granted)
+            selected = selected[:granted]
+    waiting = len(queued) - len(selected)
+    if waiting:
+        waiting_by_role = {}
+        selected_hashes = {record.prompt_hash for record in selected}
+        for record in queued:
+            if record.prompt_hash not in selected_hashes:
+                role = scheduler.role_of(record)
+                waiting_by_role[role] = waiting_by_role.get(role, 0) + 1
+        breakdown = ", ".join(f"{role}: {count}" for role, count in sorted(waiting_by_role.items()))
+        print(f"{len(running_roles)} sessions running (limit {scheduler.max_running}). "
+              f"{waiting} tasks stay queued until running sessions complete ({breakdown}).")
+        METRICS.increment("queued", waiting)
+    if not selected: return
+    new_tasks_to_create = {record.prompt_hash: record.prompt for record in selected}
+    print(f"Found {len(new_tasks_to_create)} new tasks to create (up to {CREATE_MAX_WORKERS} at a time).")
+    created_count = create_jules_tasks_concurrently(new_tasks_to_create, store)
+    if SESSION_BUDGET is not None:
+        SESSION_BUDGET.release(len(new_tasks_to_create) - created_count)
+    if created_count:
+        print(f"\nSuccessfully tracked {created_count} new tasks in {TRACKING_DB}.")
+    failed_count = len(new_tasks_to_create) - created_count
+    if failed_count:
+        print(f"{failed_count} tasks could not be created; they will be retried on the next run.")
+
 def run_create_mode():
     print("Running in CREATE mode...")
     if not sync_with_remote_and_prepare(): return
-    # ... (rest of create mode is unchanged)
-    tasks_in_todo = parse_structured_todo(TODO_FILENAME)
-    if not tasks_in_todo: print("No pending tasks found in TODO.md."); return
-    tracked_tasks = {}
-    if os.path.exists(TRACKING_FILE):
-        with open(TRACKING_FILE, 'r', newline='') as f:
-            reader = csv.reader(f)
-            for row in reader: tracked_tasks[row[0]] = row[1]
-    new_tasks_to_create = {h: p for h, p in tasks_in_todo.items() if h not in tracked_tasks}
-    if not new_tasks_to_create: print("All pending tasks in TODO.md are already being tracked."); return
-    print(f"Found {len(new_tasks_to_create)} new tasks to create.")
-    created_tasks_log = []
-    for prompt_hash, prompt in new_tasks_to_create.items():
-        session_id = create_jules_task_with_cli(prompt)
-        if session_id: created_tasks_log.append([prompt_hash, session_id, prompt])
-    if created_tasks_log:
-        with open(TRACKING_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerows(created_tasks_log)
-        print(f"\nSuccessfully tracked {len(created_tasks_log)} new tasks in {TRACKING_FILE}.")
-
-def run_review_mode():
+    pending_records = parse_pending_records(worktree_todo_path())
+    if not pending_records: print("No pending tasks found in TODO.md."); return
+    with open_tracking_store() as store:
+        recover_journal(store)
+        reconcile_edited_tasks(pending_records, store)
+        create_untracked_tasks(pending_records, store)
+
+def complete_tasks(completed_tasks: list[tuple[str, str, str]], store: TrackingStore, pr_mode: str = PR_MODE,
+                   keep_completed: int | None = None) -> set[str]:
+    """
+    Runs the TODO.md + PR completion workflow for (prompt_hash, session_id,
+    prompt) items. Each PR is journaled before its TODO.md edit and after the
+    edit and the PR, so recover_journal() can finish or discard it after a crash.
+    When the PR cannot be opened, the entry stays at "todo_edited" and its
+    tasks stay ACTIVE, so the next run's recover_journal() retries it.
+    `keep_completed` is passed to apply_todo_completions().
+    Returns the prompt hashes marked done.
+    """
+    done = set()
+    if pr_mode == "per-task":
+        for prompt_hash, full_session_id, prompt in completed_tasks:
+            print(f"\n- Completing task {full_session_id}...")
+            entry_id = store.journal_begin("complete", {
+                "branch": pull_request_branch(full_session_id), "tasks": [[prompt_hash, full_session_id]]})
+            if update_todo_for_completion(prompt, keep_completed=keep_completed):
+                store.journal_step(entry_id, "todo_edited")
+                if not create_pull_request(full_session_id, prompt_hash):
+                    print(f"  - Task {full_session_id} stays active; its Pull Request is retried by the next review or watch sync.")
+                    METRICS.increment("complete_failed")
+                    continue
+            store.journal_step(entry_id, "pr_done")
+            store.mark_done(prompt_hash)
+            store.journal_finish(entry_id)
+            METRICS.increment("completed")
+            done.add(prompt_hash)
+        return done
+    print(f"\n{len(completed_tasks)} task(s) completed. Updating {TODO_FILENAME} in a single pass...")
+    branch_name = pull_request_branch()
+    entry_id = store.journal_begin("complete", {
+        "branch": branch_name, "tasks": [[prompt_hash, session_id] for prompt_hash, session_id, _ in completed_tasks]})
+    applied_prompts = apply_todo_completions([prompt for _, _, prompt in completed_tasks], keep_completed=keep_completed)
+    applied = [(session_id, prompt) for _, session_id, prompt in completed_tasks if prompt in applied_prompts]
+    if applied:
+        store.journal_step(entry_id, "todo_edited")
+        if not create_batch_pull_request(applied, branch_name):
+            print(f"  - {len(completed_tasks)} task(s) stay active; their Pull Request is retried by the next review or watch sync.")
+            METRICS.increment("complete_failed", len(completed_tasks))
+            return done
+    store.journal_step(entry_id, "pr_done")
+    for prompt_hash, _, _ in completed_tasks:
+        store.mark_done(prompt_hash)
+        done.add(prompt_hash)
+    store.journal_finish(entry_id)
+    METRICS.increment("completed", len(completed_tasks))
+    return done
+
+def _recover_completion(store: TrackingStore, entry_id: int, step: str, payload: dict):
+    tasks = payload["tasks"]
+    branch_name = payload["branch"]
+    if step == "todo_edited" and remote_branch_exists(branch_name):
+        # The branch was pushed, so only the PR (if anything) and the bookkeeping are missing.
+        print(f"  - Branch '{branch_name}' was pushed before the interruption; re-opening its Pull Request.")
+        if len(tasks) == 1 and branch_name == pull_request_branch(tasks[0][1]):
+            _, pr_title, pr_body = _single_pull_request_text(tasks[0][1])
+        else:
+            completions = [(session_id, store.get_prompt(prompt_hash) or session_id) for prompt_hash, session_id in tasks]
+            _, pr_title, pr_body = _batch_pull_request_text(completions)
+        if not reopen_pull_request(branch_name, pr_title, pr_body):
+            print(f"  - Left open; '{branch_name}' is retried on the next run.")
+            return
+        step = "pr_done"
+    if step == "pr_done":
+        for prompt_hash, _ in tasks:
+            store.mark_done(prompt_hash)
+        store.journal_finish(entry_id)
+        print(f"  - Recorded {len(tasks)} completion(s) that finished before the interruption.")
+        return
+    # Nothing reached the remote: the worktree edit was discarded by the sync, and the
+    # tasks are still ACTIVE, so the next review redoes the whole completion.
+    store.journal_finish(entry_id, TrackingStore.ABORTED)
+    print(f"  - Completion of {len(tasks)} task(s) never reached '{GIT_REMOTE_NAME}'; it will be redone.")
+
+@timed_stage("recover")
+def recover_journal(store: TrackingStore):
+    """
+    Resumes from the journal entries an interrupted run left open. Expects
+    sync_with_remote_and_prepare() to have run.
+    - create: the CLI may have created the session before the crash, so it is
+      adopted from the remote listing if it exists; otherwise the task stays
+      untracked and is created again.
+    - complete: a pushed branch gets its PR re-opened and its tasks marked
+      done; an unpushed one is dropped so the completion is redone.
+    """
+    open_entries = store.open_journal_entries()
+    if not open_entries: return
+    print(f"Recovering {len(open_entries)} operation(s) left unfinished by an interrupted run...")
+    interrupted_creates = {}
+    for entry_id, operation, step, payload in open_entries:
+        if operation == "create":
+            interrupted_creates[entry_id] = payload
+        elif operation == "complete":
+            _recover_completion(store, entry_id, step, payload)
+    if interrupted_creates:
+        _resolve_interrupted_creates(store, interrupted_creates)
+    METRICS.increment("recovered", len(open_entries))
+
+def _resolve_interrupted_creates(store: TrackingStore, interrupted_creates: dict[int, dict]) -> int:
+    """
+    Closes create journal entries whose outcome is unknown: sessions found in
+    the remote listing are adopted, the rest stay untracked so they are
+    created again. Returns the number adopted.
+    """
+    tracked_hashes = store.tracked_hashes()
+    untracked = {payload["prompt_hash"]: payload["prompt"] for payload in interrupted_creates.values()
+                 if payload["prompt_hash"] not in tracked_hashes}
+    if untracked:
+        adopt_existing_sessions(untracked, store)
+        tracked_hashes = store.tracked_hashes()
+    adopted_count = 0
+    for entry_id, payload in interrupted_creates.items():
+        adopted = payload["prompt_hash"] in tracked_hashes
+        store.journal_finish(entry_id, TrackingStore.FINISHED if adopted else TrackingStore.ABORTED)
+        adopted_count += payload["prompt_hash"] in untracked and adopted
+    return adopted_count
+
+def run_review_mode(pr_mode: str = PR_MODE):
     print("Running in REVIEW mode...")
     if not sync_with_remote_and_prepare(): return
-    # ... (rest of review mode is unchanged)
-    if not os.path.exists(TRACKING_FILE):
-        print(f"Tracking file '{TRACKING_FILE}' not found. Nothing to review.")
+    if not os.path.exists(TRACKING_DB) and not os.path.exists(TRACKING_FILE):
+        print(f"Tracking store '{TRACKING_DB}' not found. Nothing to review.")
         return
-    all_statuses = get_all_jules_statuses()
+    with open_tracking_store() as store:
+        recover_journal(store)
+        # Edited blocks are matched to their tasks first, so the completion edit finds them.
+        reconcile_edited_tasks(parse_pending_records(worktree_todo_path()), store)
+        review_tracked_tasks(store, pr_mode)
+
+def review_tracked_tasks(store: TrackingStore, pr_mode: str = PR_MODE, fetch_statuses=get_all_jules_statuses,
+                         keep_completed: int | None = None) -> int:
+    """
+    Records the remote status of every ACTIVE task and runs the completion
+    workflow for the completed ones. `fetch_statuses(session_ids)` returns
+    (truncated_id, status) rows; the controller passes a StatusCache.get.
+    Returns the number of tasks completed (their PR opened and marked done).
+    """
+    active_tasks = store.active_tasks()
+    if not active_tasks:
+        print("No active tasks are being tracked. Nothing to review.")
+        return 0
+    all_statuses = fetch_statuses([session_id for _, session_id in active_tasks])
     if not all_statuses:
-        print("Could not retrieve any session statuses. Aborting review.")
-        return
-    with open(TRACKING_FILE, 'r', newline='', encoding='utf-8') as f:
-        all_tasks = list(csv.reader(f))
-    still_pending_tasks = []
-    has_completed_a_task = False
-    for prompt_hash, full_session_id, full_prompt in all_tasks:
+        print("Could not retrieve the status of any tracked session. Aborting review.")
+        return 0
+    status_index = build_status_index(all_statuses)
+    completed_tasks = []
+    for prompt_hash, full_session_id in active_tasks:
         print(f"- Checking task {full_session_id}...")
-        found_status = "NOT FOUND"
-        for truncated_id, status in all_statuses.items():
-            if full_session_id.startswith(truncated_id):
-                found_status = status
-                break
+        found_status = resolve_session_status(status_index, full_session_id)
         print(f"  - Status: {found_status}")
-        if found_status in ['COMPLETE', 'COMPLETED']:
-            print(f"  - Task {full_session_id} is complete! Starting completion workflow...")
-            has_completed_a_task = True
-            if update_todo_for_completion(full_prompt):
-                create_pull_request(full_session_id, prompt_hash)
-        else:
-            still_pending_tasks.append([prompt_hash, full_session_id, full_prompt])
-    with open(TRACKING_FILE, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerows(still_pending_tasks)
-    if not has_completed_a_task:
+        if found_status not in ("NOT FOUND", "AMBIGUOUS"):
+            store.set_remote_status(prompt_hash, found_status)
+        if found_status in COMPLETE_STATUSES:
+            print(f"  - Task {full_session_id} is complete! Queued for the completion workflow.")
+            completed_tasks.append((prompt_hash, full_session_id, store.get_prompt(prompt_hash)))
+    done = set()
+    if completed_tasks:
+        done = complete_tasks(completed_tasks, store, pr_mode, keep_completed)
+    else:
         print("\nNo tasks were completed since the last review.")
-    print(f"\nReview complete. {len(still_pending_tasks)} tasks remain pending.")
+    print(f"\nReview complete. {store.count_active()} tasks remain pending.")
+    return len(done)
+
+def _file_signature(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _watch_poll_statuses(store: TrackingStore, status_cache: StatusCache, known_statuses: dict[str, str],
+                         pr_mode: str) -> tuple[bool, bool]:
+    """
+    One watch-mode status poll. Only sessions whose status differs from
+    `known_statuses` are reported and recorded, and only those that turned
+    complete go through the completion workflow.
+    Returns (any_status_changed, any_session_near_completion).
+    """
+    active_tasks = store.active_tasks()
+    if not active_tasks: return False, False
+    all_statuses = status_cache.get([session_id for _, session_id in active_tasks])
+    if not all_statuses: return False, False
+    status_index = build_status_index(all_statuses)
+    changed = False
+    completed_tasks = []
+    for prompt_hash, full_session_id in active_tasks:
+        found_status = resolve_session_status(status_index, full_session_id)
+        if found_status in ("NOT FOUND", "AMBIGUOUS") or known_statuses.get(prompt_hash) == found_status:
+            continue
+        print(f"[watch] {full_session_id}: {known_statuses.get(prompt_hash, 'UNKNOWN')} -> {found_status}")
+        known_statuses[prompt_hash] = found_status
+        store.set_remote_status(prompt_hash, found_status)
+        changed = True
+        if found_status in COMPLETE_STATUSES:
+            completed_tasks.append((prompt_hash, full_session_id, store.get_prompt(prompt_hash)))
+    if completed_tasks:
+        # Tasks whose PR failed keep their known status; the next git sync retries them through recover_journal().
+        for prompt_hash in complete_tasks(completed_tasks, store, pr_mode): known_statuses.pop(prompt_hash, None)
+    near_completion = any(status in WATCH_NEAR_COMPLETION_STATUSES for status in known_statuses.values())
+    return changed, near_completion
+
+def _watch_known_statuses(store: TrackingStore) -> dict[str, str]:
+    """
+    Last recorded status of every ACTIVE task, as watch mode's baseline.
+    Completed tasks are left out so the next poll completes them, unless a
+    completion still open in the journal (a PR awaiting retry) covers them.
+    """
+    awaiting_retry = {prompt_hash for _, operation, _, payload in store.open_journal_entries()
+                      if operation == "complete" for prompt_hash, _ in payload["tasks"]}
+    return {prompt_hash: status for prompt_hash, status in store.active_remote_statuses().items()
+            if status not in COMPLETE_STATUSES or prompt_hash in awaiting_retry}
+
+def run_watch_mode(pr_mode: str = PR_MODE, create_new_tasks: bool = True):
+    """
+    Long-running create + review loop. The parsed TODO.md and the tracking
+    store stay loaded between cycles; TODO.md is re-parsed only when its
+    size or mtime changes after a git sync, and session statuses are polled
+    on an adaptive schedule: WATCH_MIN_POLL_INTERVAL while sessions are
+    changing or near completion, backing off to WATCH_MAX_POLL_INTERVAL
+    while nothing moves. Tasks the scheduler queued are started as soon as
+    a poll sees running sessions complete. Completions left open by a failed
+    PR are retried through recover_journal() after each git sync.
+    """
+    print("Running in WATCH mode (press Ctrl+C to stop)...")
+    if not sync_with_remote_and_prepare(): return
+    status_cache = StatusCache(WATCH_STATUS_CACHE_TTL)
+    poll_interval = WATCH_MIN_POLL_INTERVAL
+    todo_signature = None
+    next_git_sync = time.monotonic() + WATCH_GIT_SYNC_INTERVAL
+    next_status_poll = time.monotonic()
+    pending_records = []
+    with open_tracking_store() as store:
+        recover_journal(store)
+        known_statuses = _watch_known_statuses(store)
+        try:
+            while True:
+                if time.monotonic() >= next_git_sync:
+                    sync_with_remote_and_prepare()
+                    next_git_sync = time.monotonic() + WATCH_GIT_SYNC_INTERVAL
+                    if store.open_journal_entries():
+                        # Retries completions whose PR failed; those dropped as never pushed are redone by the next poll.
+                        recover_journal(store)
+                        known_statuses = _watch_known_statuses(store)
+                        next_status_poll = time.monotonic()
+                signature = _file_signature(worktree_todo_path())
+                if signature != todo_signature:
+                    todo_signature = signature
+                    pending_records = parse_pending_records(worktree_todo_path())
+                    print(f"[watch] {TODO_FILENAME} changed; indexed {len(pending_records)} pending tasks.")
+                    reconcile_edited_tasks(pending_records, store)
+                    if create_new_tasks and pending_records:
+                        create_untracked_tasks(pending_records, store, refresh_statuses=False)
+                    next_status_poll = time.monotonic()
+                if time.monotonic() >= next_status_poll:
+                    running_before = len(store.running_tasks())
+                    changed, near_completion = _watch_poll_statuses(store, status_cache, known_statuses, pr_mode)
+                    if create_new_tasks and pending_records and len(store.running_tasks()) < running_before:
+                        # Sessions finished, so queued tasks can take their slots.
+                        create_untracked_tasks(pending_records, store, refresh_statuses=False)
+                    if changed or near_completion:
+                        poll_interval = WATCH_MIN_POLL_INTERVAL
+                    else:
+                        poll_interval = min(poll_interval * WATCH_BACKOFF_FACTOR, WATCH_MAX_POLL_INTERVAL)
+                    next_status_poll = time.monotonic() + poll_interval
+                    print(f"[watch] {store.count_active()} active tasks. Next status poll in {poll_interval:.0f}s.")
+                time.sleep(max(0.5, min(next_git_sync, next_status_poll) - time.monotonic()))
+        except KeyboardInterrupt:
+            print("\nWatch mode stopped.")
+
+#==============================================================================
+# SECTION 5: MULTI-REPOSITORY FAN-OUT
+#==============================================================================
+class SessionBudget:
+    """
+    Number of Jules sessions the repositories of a fan-out run may still
+    create, shared between worker processes through a multiprocessing manager.
+    """
+    def __init__(self, manager, slots: int):
+        self.slots = manager.Value("i", max(0, slots))
+        self.lock = manager.Lock()
+
+    def reserve(self, wanted: int) -> int:
+        """Takes up to `wanted` slots and returns how many were granted."""
+        with self.lock:
+            granted = min(wanted, self.slots.value)
+            self.slots.value -= granted
+        return granted
+
+    def release(self, count: int):
+        if count <= 0: return
+        with self.lock:
+            self.slots.value += count
+
+SESSION_BUDGET: SessionBudget | None = None  # Set in fan-out workers; None means uncapped.
+
+FANOUT_MODES = {"sync": lambda pr_mode: run_sync_mode(),
+                "create": lambda pr_mode: run_create_mode(),
+                "review": run_review_mode}
+
+def read_manifest(path: str) -> list[str]:
+    """One repository path per line; blank lines and '#' comments are ignored. Relative paths are relative to the manifest."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    repositories = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line: repositories.append(os.path.normpath(os.path.join(base_dir, os.path.expanduser(line))))
+    return list(dict.fromkeys(repositories))
+
+def _count_active_sessions(repository: str) -> int:
+    db_path = os.path.join(repository, TRACKING_DB)
+    if not os.path.exists(db_path): return 0
+    with TrackingStore(db_path) as store:
+        return store.count_active()
+
+def _init_fanout_worker(budget: SessionBudget | None, keep_completed: int | None):
+    # Settings changed from the command line are passed explicitly: spawned workers re-import this module.
+    global SESSION_BUDGET, COMPLETED_KEEP_RECENT
+    SESSION_BUDGET = budget
+    COMPLETED_KEEP_RECENT = keep_completed
+
+def run_repository(repository: str, mode: str, pr_mode: str) -> dict:
+    """
+    Runs one mode against one repository inside a fan-out worker process.
+    Everything relative (TODO.md, the tracking store, the worktree, `--repo .`)
+    resolves inside `repository`, and the mode's output goes to
+    .jules/<mode>.log there. Returns a summary row for the aggregated report.
+    """
+    started = time.perf_counter()
+    METRICS.reset(mode)
+    log_path = os.path.join(repository, ".jules", f"{mode}.log")
+    error = None
+    try:
+        os.chdir(repository)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            FANOUT_MODES[mode](pr_mode)
+        if METRICS.snapshot()["counters"].get("sync_failed"):
+            error = "git synchronization failed"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    try:
+        active = _count_active_sessions(repository)
+    except sqlite3.Error:
+        active = None
+    return {"repository": repository, "error": error, "duration_s": time.perf_counter() - started,
+            "counters": METRICS.snapshot()["counters"], "active": active, "log": log_path}
+
+def run_fanout_mode(manifest_path: str, mode: str, pr_mode: str = PR_MODE,
+                    max_processes: int = FANOUT_MAX_PROCESSES, max_active_sessions: int | None = FANOUT_MAX_ACTIVE_SESSIONS,
+                    keep_completed: int | None = None):
+    """
+    Runs `mode` for every repository in the manifest, up to `max_processes`
+    at a time, each in its own process with its own git worktree and tracking
+    store. In create mode the repositories share one SessionBudget, so the
+    ACTIVE sessions across all of them never exceed `max_active_sessions`.
+    `keep_completed` defaults to COMPLETED_KEEP_RECENT. Prints one aggregated summary.
+    """
+    keep_completed = COMPLETED_KEEP_RECENT if keep_completed is None else keep_completed
+    repositories = read_manifest(manifest_path)
+    if not repositories: print(f"No repositories listed in '{manifest_path}'."); return
+    print(f"Running {mode.upper()} mode for {len(repositories)} repositories ({max_processes} at a time)...")
+    missing = [repository for repository in repositories if not os.path.isdir(repository)]
+    for repository in missing: print(f"  - WARNING: '{repository}' does not exist; skipped.")
+    repositories = [repository for repository in repositories if repository not in missing]
+
+    results = [{"repository": repository, "error": "not found", "duration_s": 0.0, "counters": {}, "active": None,
+                "log": None} for repository in missing]
+    with multiprocessing.Manager() as manager:
+        budget = None
+        if mode == "create" and max_active_sessions is not None:
+            active = sum(_count_active_sessions(repository) for repository in repositories)
+            budget = SessionBudget(manager, max_active_sessions - active)
+            print(f"  - {active} sessions already active; {budget.slots.value} more may be created "
+                  f"(cap {max_active_sessions}).")
+        with ProcessPoolExecutor(max_workers=max_processes, initializer=_init_fanout_worker,
+                                 initargs=(budget, keep_completed)) as pool:
+            futures = {pool.submit(run_repository, repository, mode, pr_mode): repository for repository in repositories}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:  # The worker process itself died.
+                    result = {"repository": futures[future], "error": f"{type(e).__name__}: {e}", "duration_s": 0.0,
+                              "counters": {}, "active": None, "log": None}
+                outcome = f"FAILED ({result['error']})" if result["error"] else "ok"
+                print(f"  - {result['repository']}: {outcome} in {result['duration_s']:.1f}s")
+                results.append(result)
+    print_fanout_summary(mode, results)
+
+def print_fanout_summary(mode: str, results: list[dict]):
+    columns = ("created", "adopted", "completed", "create_failed", "prs_opened", "prs_failed")
+    totals = dict.fromkeys(columns, 0)
+    common_dir = os.path.commonpath([r["repository"] for r in results]) if len(results) > 1 else ""
+    if common_dir in {r["repository"] for r in results}: common_dir = os.path.dirname(common_dir)
+    names = {r["repository"]: os.path.relpath(r["repository"], common_dir) if common_dir else r["repository"]
+             for r in results}
+    name_width = max(len("Repository"), *(len(name) for name in names.values()))
+    print(f"\n{mode.upper()} summary for {len(results)} repositories:")
+    print(f"  {'Repository':<{name_width}}  {'Result':<7} {'Time':>7} " + " ".join(f"{c:>13}" for c in columns) + f" {'Active':>7}")
+    for result in sorted(results, key=lambda r: r["repository"]):
+        counters = result["counters"]
+        for column in columns: totals[column] += counters.get(column, 0)
+        for name, value in counters.items(): METRICS.increment(name, value)
+        active = "-" if result["active"] is None else str(result["active"])
+        print(f"  {names[result['repository']]:<{name_width}}  "
+              f"{'FAILED' if result['error'] else 'ok':<7} {result['duration_s']:>6.1f}s "
+              + " ".join(f"{counters.get(c, 0):>13}" for c in columns) + f" {active:>7}")
+    failed = [result for result in results if result["error"]]
+    print(f"  {'TOTAL':<{name_width}}  {f'{len(results) - len(failed)} ok':<7} {'':>7} "
+          + " ".join(f"{totals[c]:>13}" for c in columns)
+          + f" {sum(r['active'] or 0 for r in results):>7}")
+    for result in failed:
+        log_hint = f" See {result['log']}." if result["log"] else ""
+        print(f"  - {result['repository']}: {result['error']}.{log_hint}")
+
+#==============================================================================
+# SECTION 6: RESIDENT CONTROLLER
+#==============================================================================
+CONTROLLER_JOB_OPTIONS = ("pr_mode", "keep_completed", "metrics_json", "metrics_prom")  # Client flags applied per job.
+
+class ControllerJob:
+    def __init__(self, job_id: int, command: str, options: dict | None = None):
+        self.id = job_id
+        self.command = command
+        self.options = options or {}
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.output = ""
+        self.done = threading.Event()
+
+    def to_dict(self, with_output: bool = False) -> dict:
+        job = {"id": self.id, "command": self.command, "state": self.state, "error": self.error,
+               "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at}
+        if with_output: job["output"] = self.output
+        return job
+
+class Controller:
+    """
+    Resident state for `serve` mode. One worker thread owns the tracking
+    store and runs create/review/refresh jobs in submission order, keeping
+    the git worktree, the parsed TODO.md and the status cache warm between
+    them: git is synced at most every WATCH_GIT_SYNC_INTERVAL seconds and
+    TODO.md is re-parsed only when its size or mtime changes.
+    Requests are answered from snapshots the worker publishes after each
+    job, so `status` and `list` never wait for git or the Jules CLI.
+    """
+    def __init__(self, pr_mode: str = PR_MODE):
+        self.pr_mode = pr_mode
+        self.jobs = {}
+        self.job_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_job_id = 1
+        self.status_cache = StatusCache(WATCH_STATUS_CACHE_TTL)
+        self.pending_records = []
+        self.todo_signature = None
+        self.next_git_sync = 0.0
+        self.tasks_snapshot = []
+        self.tracked_hashes = set()
+        self.snapshot_at = None
+        self.worker = threading.Thread(target=self._work, name="controller-worker", daemon=True)
+
+    # --- Request side (socket server threads) ---
+    def submit(self, command: str, options: dict | None = None) -> ControllerJob:
+        with self.lock:
+            if command == "refresh":
+                # One queued refresh is enough.
+                queued = next((job for job in self.jobs.values() if job.command == command and job.state == "queued"), None)
+                if queued: return queued
+            job = ControllerJob(self.next_job_id, command, options)
+            self.next_job_id += 1
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, old in self.jobs.items() if old.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - CONTROLLER_JOB_HISTORY)]: del self.jobs[job_id]
+        self.job_queue.put(job)
+        return job
+
+    def handle(self, request: dict) -> dict:
+        command = request.get("command")
+        if command in ("create", "review"):
+            options = {name: request[name] for name in CONTROLLER_JOB_OPTIONS if request.get(name) is not None}
+            job = self.submit(command, options)
+            if request.get("wait"):
+                job.done.wait()
+            return {"ok": True, "job": job.to_dict(with_output=bool(request.get("wait")))}
+        if command == "status":
+            if request.get("job") is not None:
+                job = self.jobs.get(int(request["job"]))
+                if job is None: return {"ok": False, "error": f"unknown job {request['job']}"}
+                return {"ok": True, "job": job.to_dict(with_output=True)}
+            with self.lock:
+                snapshot_age = None if self.snapshot_at is None else time.time() - self.snapshot_at
+                tasks = list(self.tasks_snapshot)
+                jobs = [job.to_dict() for job in self.jobs.values()]
+            if snapshot_age is None or snapshot_age > CONTROLLER_STATUS_TTL:
+                self.submit("refresh")
+            return {"ok": True, "tasks": tasks, "snapshot_age_s": snapshot_age, "jobs": jobs}
+        if command == "list":
+            with self.lock:
+                records, tracked_hashes = list(self.pending_records), set(self.tracked_hashes)
+            return {"ok": True, "tasks": [
+                {"prompt_hash": record.prompt_hash, "role": record.role, "priority": record.priority,
+                 "tracked": record.prompt_hash in tracked_hashes, "task": record.prompt.splitlines()[0]}
+                for record in records]}
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        return {"ok": False, "error": f"unknown command {command!r}"}
+
+    # --- Worker side ---
+    def _refresh_inputs(self, store: TrackingStore):
+        if time.monotonic() >= self.next_git_sync:
+            sync_with_remote_and_prepare()
+            self.next_git_sync = time.monotonic() + WATCH_GIT_SYNC_INTERVAL
+        signature = _file_signature(worktree_todo_path())
+        if signature != self.todo_signature:
+            self.todo_signature = signature
+            records = parse_pending_records(worktree_todo_path())
+            with self.lock: self.pending_records = records
+            reconcile_edited_tasks(records, store)
+
+    def _publish(self, store: TrackingStore):
+        tasks, tracked_hashes = store.active_task_details(), store.tracked_hashes()
+        with self.lock:
+            self.tasks_snapshot, self.tracked_hashes, self.snapshot_at = tasks, tracked_hashes, time.time()
+
+    def _run_job(self, job: ControllerJob, store: TrackingStore):
+        self._refresh_inputs(store)
+        if job.command == "create":
+            if self.pending_records: create_untracked_tasks(self.pending_records, store)
+            else: print("No pending tasks found in TODO.md.")
+        elif job.command == "review":
+            # Completions an earlier job left open (e.g. a failed PR) are finished first, so they are not redone.
+            recover_journal(store)
+            review_tracked_tasks(store, job.options.get("pr_mode", self.pr_mode), self.status_cache.get,
+                                 job.options.get("keep_completed"))
+        elif job.command == "refresh":
+            refresh_running_statuses(store)
+
+    def _work(self):
+        global METRICS
+        with open_tracking_store() as store:
+            recover_journal(store)
+            self._refresh_inputs(store)
+            self._publish(store)
+            while True:
+                job = self.job_queue.get()
+                if job is None: return
+                job.state, job.started_at = "running", time.time()
+                output = io.StringIO()
+                # Each job records into its own Metrics, exported if the client asked for it and then
+                # folded into the controller's totals.
+                serve_metrics, METRICS = METRICS, Metrics(job.command)
+                try:
+                    with contextlib.redirect_stdout(output):
+                        self._run_job(job, store)
+                    job.state = "done"
+                except Exception as e:
+                    job.state, job.error = "failed", f"{type(e).__name__}: {e}"
+                finally:
+                    job_metrics, METRICS = METRICS, serve_metrics
+                    METRICS.merge(job_metrics)
+                try:
+                    if job.options.get("metrics_json"): job_metrics.write_json(job.options["metrics_json"])
+                    if job.options.get("metrics_prom"): job_metrics.write_prometheus(job.options["metrics_prom"])
+                except OSError as e:
+                    print(f"  - WARNING: Could not write the job's metrics: {e}", file=output)
+                job.output, job.finished_at = output.getvalue(), time.time()
+                print(f"[controller] Job {job.id} ({job.command}) {job.state} in "
+                      f"{job.finished_at - job.started_at:.1f}s.", file=sys.stderr)
+                self._publish(store)
+                job.done.set()
+
+class _ControllerRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line, answered with one JSON line."""
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip(): continue
+            try:
+                response = self.server.controller.handle(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+def controller_request(request: dict, socket_path: str = CONTROLLER_SOCKET, timeout: float | None = CONTROLLER_CLIENT_TIMEOUT) -> dict | None:
+    """Sends one request to a running controller. Returns None if none is listening on `socket_path`."""
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path): return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with client.makefile("r", encoding="utf-8") as replies:
+                return json.loads(replies.readline())
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+def run_serve_mode(pr_mode: str = PR_MODE, socket_path: str = CONTROLLER_SOCKET):
+    """Runs the resident controller until Ctrl+C. See Controller for what is kept warm."""
+    if not hasattr(socket, "AF_UNIX"):
+        print("ERROR: serve mode needs Unix domain sockets, which this platform does not provide.")
+        return
+    if controller_request({"command": "ping"}, socket_path) is not None:
+        print(f"A controller is already listening on '{socket_path}'.")
+        return
+    with contextlib.suppress(FileNotFoundError): os.remove(socket_path)  # Left behind by a controller that died.
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    controller = Controller(pr_mode)
+    print(f"Running in SERVE mode on '{socket_path}' (press Ctrl+C to stop)...")
+    with socketserver.ThreadingUnixStreamServer(socket_path, _ControllerRequestHandler) as server:
+        server.daemon_threads = True
+        server.controller = controller
+        # SIGTERM (e.g. from a service manager) stops the server like Ctrl+C; shutdown() must run off this thread.
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        controller.worker.start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nController stopped.")
+        finally:
+            controller.job_queue.put(None)
+            with contextlib.suppress(FileNotFoundError): os.remove(socket_path)
+
+def print_controller_reply(command: str, reply: dict):
+    if not reply.get("ok"):
+        print(f"Controller error: {reply.get('error')}")
+        return
+    if "job" in reply:
+        job = reply["job"]
+        if job.get("output"): print(job["output"], end="")
+        suffix = f": {job['error']}" if job.get("error") else ""
+        print(f"Controller job {job['id']} ({job['command']}) is {job['state']}{suffix}.")
+        if job["state"] in ("queued", "running"):
+            print(f"Follow it with: python {os.path.basename(__file__)} status --job {job['id']}")
+        return
+    if command == "list":
+        for task in reply["tasks"]:
+            marker = "tracked" if task["tracked"] else "new"
+            print(f"  [{marker:<7}] {task['role'] or '-':<11} {task['task']}")
+        print(f"{len(reply['tasks'])} pending tasks in {TODO_FILENAME}.")
+        return
+    age = reply.get("snapshot_age_s")
+    print(f"{len(reply['tasks'])} active tasks (as of {age:.0f}s ago):" if age is not None else "No snapshot yet.")
+    for task in reply["tasks"]:
+        print(f"  {task['session_id']:<20} {task['remote_status'] or 'UNKNOWN':<24} {task['task']}")
+    for job in reply["jobs"]:
+        if job["state"] in ("queued", "running"):
+            print(f"  job {job['id']}: {job['command']} {job['state']}")
 
 #==============================================================================
 # SCRIPT ENTRYPOINT
 #==============================================================================
 if __name__ == "__main__":
-    if len(sys.argv) < 2 or sys.argv[1] not in ['create', 'review', 'sync']:
-        print("Usage: python agent_controller_final_v5.py [mode]")
-        print("Modes:")
-        print("  sync     - Scans for existing Jules sessions and adopts them into the tracking file.")
-        print("  create   - Creates Jules tasks for any new, untracked items in TODO.md.")
-        print("  review   - Reviews tracked tasks, and if complete, fully updates TODO and creates a PR.")
-        sys.exit(1)
-
-    mode = sys.argv[1]
-    
-    if mode == "sync":
-        run_sync_mode()
-    elif mode == "create":
-        run_create_mode()
-    elif mode == "review":
-        run_review_mode()
-
-    print("\nScript finished.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Creates, adopts and reviews Jules sessions for the tasks in TODO.md.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="Modes:\n"
+               "  sync     - Scans for existing Jules sessions and adopts them into the tracking store.\n"
+               "  create   - Creates Jules tasks for any new, untracked items in TODO.md.\n"
+               "  review   - Reviews tracked tasks, and if complete, fully updates TODO and creates a PR.\n"
+               "  watch    - Keeps running: creates tasks as TODO.md changes and reviews them as their status changes.\n"
+               "  serve    - Keeps running as a resident controller on a Unix socket. While it runs, create and\n"
+               "             review are handed to it and return at once; status and list query it.\n\n"
+               "With --manifest, sync/create/review run for every repository listed in the manifest file.")
+    parser.add_argument("mode", choices=["sync", "create", "review", "watch", "serve", "status", "list"])
+    parser.add_argument("--per-task-prs", action="store_true",
+                        help="review/watch: open one branch and PR per completed task instead of one per run.")
+    parser.add_argument("--review-only", action="store_true",
+                        help="watch: do not create sessions for new TODO.md tasks, only review tracked ones.")
+    parser.add_argument("--wait", action="store_true",
+                        help="create/review via the controller: wait for the job and print its output.")
+    parser.add_argument("--job", type=int, help="status: show one controller job and its output.")
+    parser.add_argument("--no-controller", action="store_true",
+                        help="create/review: run in this process even if a controller is running.")
+    parser.add_argument("--keep-completed", type=int, metavar="N",
+                        help=f"review/watch: keep the N newest Completed entries in {TODO_FILENAME} and move older "
+                             f"ones to {TODO_ARCHIVE_FILENAME}.")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="sync/create/review: run for each repository path listed in PATH (one per line), in parallel.")
+    parser.add_argument("--processes", type=int, default=FANOUT_MAX_PROCESSES,
+                        help="--manifest: number of repositories processed at once.")
+    parser.add_argument("--max-sessions", type=int, default=FANOUT_MAX_ACTIVE_SESSIONS,
+                        help="--manifest create: cap on ACTIVE Jules sessions across all repositories.")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="Write stage timings, command latencies and task counters to PATH as JSON. "
+                             "For a job handed to the controller, it writes them when the job finishes.")
+    parser.add_argument("--metrics-prom", metavar="PATH",
+                        help="Write the same metrics as a Prometheus textfile-collector file (e.g. auto_agent.prom).")
+    args = parser.parse_args()
+    METRICS.reset(args.mode)
+    if args.keep_completed is not None and args.keep_completed < 0:
+        parser.error("--keep-completed must be 0 or more.")
+    if args.keep_completed is not None:
+        COMPLETED_KEEP_RECENT = args.keep_completed
+
+    if args.manifest and args.mode not in ("sync", "create", "review"):
+        parser.error("--manifest supports the sync, create and review modes.")
+
+    if args.mode in ("create", "review", "status", "list") and not (args.manifest or args.no_controller):
+        request = {"command": args.mode, "wait": args.wait, "job": args.job,
+                   "pr_mode": "per-task" if args.per_task_prs else None, "keep_completed": args.keep_completed,
+                   "metrics_json": args.metrics_json and os.path.abspath(args.metrics_json),
+                   "metrics_prom": args.metrics_prom and os.path.abspath(args.metrics_prom)}
+        reply = controller_request(request, timeout=None if args.wait else CONTROLLER_CLIENT_TIMEOUT)
+        if reply is not None:
+            print_controller_reply(args.mode, reply)
+            sys.exit(0 if reply.get("ok") else 1)
+        if args.mode in ("status", "list"):
+            print(f"No controller is running. Start one with: python {os.path.basename(__file__)} serve")
+            sys.exit(1)
+
+    try:
+        if args.manifest:
+            run_fanout_mode(args.manifest, args.mode, "per-task" if args.per_task_prs else PR_MODE,
+                            max_processes=args.processes, max_active_sessions=args.max_sessions,
+                            keep_completed=args.keep_completed)
+        elif args.mode == "sync":
+            run_sync_mode()
+        elif args.mode == "create":
+            run_create_mode()
+        elif args.mode == "review":
+            run_review_mode("per-task" if args.per_task_prs else PR_MODE)
+        elif args.mode == "serve":
+            run_serve_mode("per-task" if args.per_task_prs else PR_MODE)
+        elif args.mode == "watch":
+            run_watch_mode("per-task" if args.per_task_prs else PR_MODE, create_new_tasks=not args.review_only)
+    finally:
+        # Also written when a mode fails or watch mode is stopped, so slow or broken runs are visible.
+        if args.metrics_json: METRICS.write_json(args.metrics_json)
+        if args.metrics_prom: METRICS.write_prometheus(args.metrics_prom)
+
+    print("\nScript finished.")
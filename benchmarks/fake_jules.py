@@ -0,0 +1,145 @@
+"""
+Offline stand-in for the Jules CLI (and `gh`) used by the benchmarks.
+
+Supports the two commands auto_agent.py issues:
+    fake_jules.py remote new --repo . --session PROMPT
+    fake_jules.py remote list --session
+and swallows `gh ...` calls when invoked as `fake_jules.py gh ...`.
+
+Behaviour is configured through environment variables so that the wrapper
+executables created by `install_wrappers` need no arguments:
+    FAKE_JULES_STATE         JSON-lines file recording created sessions (required).
+    FAKE_JULES_LATENCY       Seconds each call sleeps before answering (default 0).
+    FAKE_JULES_FAILURE_RATE  Probability in [0, 1] that `remote new` fails (default 0).
+    FAKE_JULES_STATUSES      Status distribution, e.g. "COMPLETED=0.3,IN_PROGRESS=0.7".
+    FAKE_JULES_HISTORY       Number of extra, untracked historical sessions to list (default 0).
+    FAKE_JULES_SEED          Seed for every random decision (default 0).
+
+All decisions are derived from the seed and the call's inputs, never from
+wall-clock time or process IDs, so repeated runs produce identical output.
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_STATUSES = "COMPLETED=0.3,IN_PROGRESS=0.5,AWAITING_USER_FEEDBACK=0.2"
+DESCRIPTION_WIDTH = 40
+LISTED_ID_WIDTH = 12
+
+
+def _unit(*parts) -> float:
+    """Deterministic pseudo-random number in [0, 1) derived from `parts`."""
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _session_id(*parts) -> str:
+    return str(int(hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest(), 16))[:19]
+
+
+def _parse_statuses(spec: str) -> list[tuple[str, float]]:
+    weights = []
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        weights.append((name.strip(), float(weight or 1)))
+    total = sum(weight for _, weight in weights)
+    return [(name, weight / total) for name, weight in weights]
+
+
+def _pick_status(session_id: str, statuses: list[tuple[str, float]], seed: str) -> str:
+    point = _unit(seed, "status", session_id)
+    for name, weight in statuses:
+        if point < weight: return name
+        point -= weight
+    return statuses[-1][0]
+
+
+def _read_state(path: str) -> list[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _append_state(path: str, entry: dict):
+    # A single small O_APPEND write, so concurrent `remote new` calls never interleave.
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry) + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _describe(prompt: str) -> str:
+    first_line = " ".join(prompt.splitlines()[0].split())
+    if len(first_line) <= DESCRIPTION_WIDTH: return first_line
+    return first_line[:DESCRIPTION_WIDTH] + "…"
+
+
+def remote_new(prompt: str, state_path: str, failure_rate: float, seed: str) -> int:
+    attempt = sum(1 for entry in _read_state(state_path) if entry.get("prompt") == prompt)
+    if _unit(seed, "fail", prompt, attempt) < failure_rate:
+        _append_state(state_path, {"prompt": prompt, "failed": True})
+        print("Error: simulated transient failure", file=sys.stderr)
+        return 1
+    session_id = _session_id(seed, "session", prompt, attempt)
+    _append_state(state_path, {"prompt": prompt, "session_id": session_id})
+    print("Session created.")
+    print(f"Session ID: {session_id}")
+    return 0
+
+
+def remote_list(state_path: str, statuses: list[tuple[str, float]], history: int, seed: str) -> int:
+    print(f"{'ID':<{LISTED_ID_WIDTH + 1}}  {'Description':<{DESCRIPTION_WIDTH + 1}}  Repo  Last active  Status")
+    sessions = [entry for entry in _read_state(state_path) if "session_id" in entry]
+    rows = [(entry["session_id"], _describe(entry["prompt"])) for entry in reversed(sessions)]
+    rows += [(_session_id(seed, "history", i), f"Historical task number {i}") for i in range(history)]
+    for session_id, description in rows:
+        status = _pick_status(session_id, statuses, seed)
+        print(f"{session_id[:LISTED_ID_WIDTH]}…  {description:<{DESCRIPTION_WIDTH + 1}}  .  1 day ago  {status}")
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    time.sleep(float(os.environ.get("FAKE_JULES_LATENCY", "0")))
+    if argv[:1] == ["gh"]:
+        return 0
+    state_path = os.environ["FAKE_JULES_STATE"]
+    seed = os.environ.get("FAKE_JULES_SEED", "0")
+    if argv[:2] == ["remote", "new"] and "--session" in argv:
+        prompt = argv[argv.index("--session") + 1]
+        return remote_new(prompt, state_path, float(os.environ.get("FAKE_JULES_FAILURE_RATE", "0")), seed)
+    if argv[:2] == ["remote", "list"]:
+        statuses = _parse_statuses(os.environ.get("FAKE_JULES_STATUSES", DEFAULT_STATUSES))
+        return remote_list(state_path, statuses, int(os.environ.get("FAKE_JULES_HISTORY", "0")), seed)
+    print(f"fake_jules: unsupported command: {' '.join(argv)}", file=sys.stderr)
+    return 2
+
+
+def install_wrappers(bin_dir: str) -> tuple[str, str]:
+    """
+    Writes `jules` and `gh` executables into `bin_dir` that run this script
+    with the current interpreter. Returns (jules_path, gh_path).
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.abspath(__file__)
+    paths = []
+    for name, prefix in (("jules", ""), ("gh", "gh ")):
+        if os.name == "nt":
+            path = os.path.join(bin_dir, f"{name}.cmd")
+            content = f'@"{sys.executable}" "{script}" {prefix}%*\r\n'
+        else:
+            path = os.path.join(bin_dir, name)
+            content = f'#!/bin/sh\nexec "{sys.executable}" "{script}" {prefix}"$@"\n'
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(path, 0o755)
+        paths.append(path)
+    return paths[0], paths[1]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
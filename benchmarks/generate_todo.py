@@ -0,0 +1,62 @@
+"""
+Generates synthetic TODO.md files in the Pending/Completed block format that
+auto_agent.py and run_smart_tasks.py parse.
+
+Output is fully determined by the arguments, so benchmark runs with the same
+seed always see the same file.
+
+Usage:
+    python benchmarks/generate_todo.py 10000 --completed 5000 --seed 1 > TODO.md
+"""
+import argparse
+import random
+import sys
+
+ROLES = {
+    "Programmer": ("Programmer Agent", ["Implement", "Refactor", "Optimize", "Fix", "Port"]),
+    "Artist": ("Artist Agent", ["Design", "Draw", "Animate", "Export", "Recolor"]),
+    "Researcher": ("Researcher Agent", ["Research", "Summarize", "Compare", "Evaluate", "Benchmark"]),
+}
+SUBJECTS = ["road generator", "WFC building solver", "resource manager", "colonist AI", "tile set",
+            "UI panel", "power grid", "pathfinding", "save system", "neon shader", "market prices",
+            "weather system", "drone swarm", "district zoning", "sound mixer"]
+DETAILS = ["so it scales to large maps", "using the existing TileMap", "with unit-level profiling",
+           "to match the cyberpunk palette", "and document the findings in docs/",
+           "behind a feature flag", "with deterministic seeds", "for the first playable build"]
+
+
+def _task_lines(rng: random.Random, task_number: int, verbs: list[str]) -> list[str]:
+    steps = []
+    for step in range(1, rng.randint(1, 4) + 1):
+        subject = rng.choice(SUBJECTS)
+        steps.append(f"    {step}. {rng.choice(verbs)} the {subject} {rng.choice(DETAILS)} (task #{task_number}.{step}).")
+    return steps
+
+
+def generate_todo(pending_count: int, completed_count: int = 0, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    role_names = sorted(ROLES)
+    lines = ["# Project TODO List", "", "This file outlines the tasks for the development team.", "",
+             "---", "## **Pending Tasks**", "---", ""]
+    for task_number in range(pending_count):
+        role = rng.choice(role_names)
+        assignee, verbs = ROLES[role]
+        lines += [f"### **{role}**", f"- **Assignee:** {assignee}", "- **Status:** Pending", "- **Task:**"]
+        lines += _task_lines(rng, task_number, verbs)
+        lines += [f"- **Goal:** Deliver milestone {task_number % 50} for the {role.lower()} team.", "", "---", ""]
+    lines += ["## **Completed Tasks**", "---", ""]
+    for task_number in range(pending_count, pending_count + completed_count):
+        role = rng.choice(role_names)
+        lines += [f"### **{role}**", "- **Status:** Complete", "- **Task:**"]
+        lines += _task_lines(rng, task_number, ROLES[role][1])
+        lines += ["", "---", ""]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic structured TODO.md.")
+    parser.add_argument("pending", type=int, help="Number of tasks in the Pending section.")
+    parser.add_argument("--completed", type=int, default=0, help="Number of tasks in the Completed section.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.stdout.write(generate_todo(args.pending, args.completed, args.seed))
@@ -0,0 +1,267 @@
+"""
+Deterministic, offline benchmarks for the TODO.md parser, the TODO.md
+completion editor and the three auto_agent.py modes.
+
+Every Jules and `gh` call goes to benchmarks/fake_jules.py, and every git
+operation runs against a throwaway local repository with a bare "origin",
+so nothing touches the network or the real TODO.md. TODO.md files come from
+benchmarks/generate_todo.py with a fixed seed.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --mode-tasks 200 --output bench.json
+
+Results are written as JSON (to stdout unless --output is given). Each entry
+has a `name`, the `size` it ran at, and `min_s` / `median_s` / `runs` timings
+in seconds; mode benchmarks also report tracking-store counts, and a
+benchmark that raised records its `error` instead of timings.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import auto_agent  # noqa: E402
+import todo_parser  # noqa: E402
+from fake_jules import install_wrappers, remote_new  # noqa: E402
+from generate_todo import generate_todo  # noqa: E402
+
+
+def _summarize(name: str, size: int, runs: list[float], **extra) -> dict:
+    return {"name": name, "size": size, "min_s": min(runs), "median_s": statistics.median(runs),
+            "runs": runs, **extra}
+
+
+def _time_runs(repeat: int, setup, func) -> list[float]:
+    """Calls setup() then times func(setup_result) `repeat` times. Output is swallowed."""
+    runs = []
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepared = setup(i)
+            started = time.perf_counter()
+            func(prepared)
+            runs.append(time.perf_counter() - started)
+    return runs
+
+
+def _write_aged(path: str, content: str):
+    """Writes `content` and backdates its mtime so the parser's racy-mtime guard does not apply."""
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(content)
+    aged = time.time() - 60
+    os.utime(path, (aged, aged))
+
+
+def bench_parser_and_editor(size: int, repeat: int, seed: int, workdir: str) -> list[dict]:
+    results = []
+    todo_path = os.path.join(workdir, f"TODO-{size}.md")
+    content = generate_todo(size, size // 4, seed)
+    _write_aged(todo_path, content)
+    prompts = list(auto_agent.parse_structured_todo(todo_path).values())
+
+    def clear_index(_):
+        shutil.rmtree(todo_parser.INDEX_DIR, ignore_errors=True)
+
+    runs = _time_runs(repeat, clear_index, lambda _: auto_agent.parse_structured_todo(todo_path))
+    results.append(_summarize("parse_structured_todo.cold", size, runs))
+
+    auto_agent.parse_structured_todo(todo_path)
+    runs = _time_runs(repeat, lambda _: None, lambda _: auto_agent.parse_structured_todo(todo_path))
+    results.append(_summarize("parse_structured_todo.unchanged", size, runs))
+
+    def edit_one_block(i):
+        # Same length every time, so only the content hash (not the size) reveals the edit.
+        target = f"(task #{size // 2}.1)"
+        _write_aged(todo_path, content.replace(target, f"(task #{size // 2}.{i % 10})", 1) if i % 2 else content)
+
+    runs = _time_runs(repeat, edit_one_block, lambda _: auto_agent.parse_structured_todo(todo_path))
+    results.append(_summarize("parse_structured_todo.one_block_edited", size, runs))
+
+    def fresh_file(_):
+        _write_aged(todo_path, content)
+        auto_agent.parse_structured_todo(todo_path)
+
+    middle_prompt = prompts[len(prompts) // 2]
+    runs = _time_runs(repeat, fresh_file, lambda _: auto_agent.update_todo_for_completion(middle_prompt, todo_path))
+    results.append(_summarize("update_todo_for_completion", size, runs))
+
+    batch = prompts[::max(1, len(prompts) // 100)][:100]
+    runs = _time_runs(repeat, fresh_file, lambda _: auto_agent.apply_todo_completions(batch, todo_path))
+    results.append(_summarize("apply_todo_completions.batch", size, runs, batch_size=len(batch)))
+
+    archive_path = os.path.join(workdir, auto_agent.TODO_ARCHIVE_FILENAME)
+
+    def fresh_file_without_archive(i):
+        fresh_file(i)
+        with contextlib.suppress(FileNotFoundError): os.remove(archive_path)
+
+    runs = _time_runs(repeat, fresh_file_without_archive,
+                      lambda _: auto_agent.apply_todo_completions(batch, todo_path, keep_completed=len(batch)))
+    results.append(_summarize("apply_todo_completions.batch_archiving", size, runs, batch_size=len(batch)))
+
+    # Steady state once old entries live in the archive: TODO.md only holds the recent history.
+    recent_content = generate_todo(size, len(batch), seed)
+    def fresh_recent_file(_):
+        _write_aged(todo_path, recent_content)
+        auto_agent.parse_structured_todo(todo_path)
+
+    runs = _time_runs(repeat, fresh_recent_file, lambda _: auto_agent.apply_todo_completions(batch, todo_path))
+    results.append(_summarize("apply_todo_completions.batch_after_archiving", size, runs, batch_size=len(batch)))
+    return results
+
+
+def _git(*args: str, cwd: str | None = None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _make_repository(root: str, todo_content: str) -> str:
+    remote = os.path.join(root, "origin.git")
+    clone = os.path.join(root, "project")
+    _git("init", "--quiet", "--bare", remote)
+    _git("symbolic-ref", "HEAD", f"refs/heads/{auto_agent.MAIN_BRANCH_NAME}", cwd=remote)
+    _git("init", "--quiet", clone)
+    _git("checkout", "--quiet", "-b", auto_agent.MAIN_BRANCH_NAME, cwd=clone)
+    _git("config", "user.email", "bench@example.invalid", cwd=clone)
+    _git("config", "user.name", "Benchmark", cwd=clone)
+    with open(os.path.join(clone, auto_agent.TODO_FILENAME), "w", encoding="utf-8", newline="\n") as f:
+        f.write(todo_content)
+    _git("add", auto_agent.TODO_FILENAME, cwd=clone)
+    _git("commit", "--quiet", "-m", "Initial TODO", cwd=clone)
+    _git("remote", "add", auto_agent.GIT_REMOTE_NAME, remote, cwd=clone)
+    _git("push", "--quiet", auto_agent.GIT_REMOTE_NAME, auto_agent.MAIN_BRANCH_NAME, cwd=clone)
+    return clone
+
+
+def _store_counts() -> dict:
+    if not os.path.exists(auto_agent.TRACKING_DB): return {"tracked": 0, "active": 0}
+    with auto_agent.TrackingStore() as store:
+        return {"tracked": len(store.tracked_hashes()), "active": store.count_active()}
+
+
+def bench_modes(args: argparse.Namespace, workdir: str) -> list[dict]:
+    """Runs sync, create and review once each, in that order, against a fresh repository."""
+    results = []
+    root = os.path.join(workdir, "modes")
+    os.makedirs(root)
+    todo_content = generate_todo(args.mode_tasks, args.mode_tasks // 4, args.seed)
+    clone = _make_repository(root, todo_content)
+    jules_path, _ = install_wrappers(os.path.join(root, "bin"))
+    state_path = os.path.join(root, "fake_jules_state.jsonl")
+
+    environment = {
+        "FAKE_JULES_STATE": state_path,
+        "FAKE_JULES_LATENCY": str(args.latency),
+        "FAKE_JULES_FAILURE_RATE": str(args.failure_rate),
+        "FAKE_JULES_STATUSES": args.statuses,
+        "FAKE_JULES_HISTORY": str(args.history),
+        "FAKE_JULES_SEED": str(args.seed),
+        "PATH": os.path.join(root, "bin") + os.pathsep + os.environ.get("PATH", ""),
+    }
+    saved_environment = {key: os.environ.get(key) for key in environment}
+    saved_settings = {name: getattr(auto_agent, name) for name in
+                      ("JULES_EXECUTABLE_PATH", "CREATE_RATE_PER_SECOND", "CREATE_RETRY_BASE_DELAY",
+                       "SCHEDULER_MAX_RUNNING", "SCHEDULER_ROLE_QUOTAS", "SCHEDULER_DEFAULT_ROLE_QUOTA")}
+    original_cwd = os.getcwd()
+    os.environ.update(environment)
+    auto_agent.JULES_EXECUTABLE_PATH = jules_path
+    auto_agent.CREATE_RATE_PER_SECOND = args.create_rate
+    auto_agent.CREATE_RETRY_BASE_DELAY = 0.01
+    # Create every task in one run so the timing covers the whole backlog, not one scheduler window.
+    auto_agent.SCHEDULER_MAX_RUNNING = args.mode_tasks
+    auto_agent.SCHEDULER_ROLE_QUOTAS = {}
+    auto_agent.SCHEDULER_DEFAULT_ROLE_QUOTA = args.mode_tasks
+    try:
+        os.chdir(clone)
+        # Sessions that already exist remotely but are not tracked, for sync mode to adopt.
+        prompts = list(auto_agent.parse_structured_todo(auto_agent.TODO_FILENAME).values())
+        with contextlib.redirect_stdout(io.StringIO()):
+            for prompt in prompts[:int(len(prompts) * args.preexisting)]:
+                remote_new(prompt, state_path, 0.0, str(args.seed))
+
+        for name, run_mode in (("mode.sync", auto_agent.run_sync_mode),
+                               ("mode.create", auto_agent.run_create_mode),
+                               ("mode.review", auto_agent.run_review_mode)):
+            started = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_mode()
+            except Exception as e:
+                results.append({"name": name, "size": args.mode_tasks, "error": f"{type(e).__name__}: {e}"})
+                continue
+            elapsed = time.perf_counter() - started
+            results.append(_summarize(name, args.mode_tasks, [elapsed], **_store_counts()))
+    finally:
+        os.chdir(original_cwd)
+        for name, value in saved_settings.items(): setattr(auto_agent, name, value)
+        for key, value in saved_environment.items():
+            if value is None: os.environ.pop(key, None)
+            else: os.environ[key] = value
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline auto_agent.py benchmarks.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma-separated pending-task counts for the parser/editor benchmarks.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per parser/editor benchmark.")
+    parser.add_argument("--mode-tasks", type=int, default=100, help="Pending tasks for the mode benchmarks (0 skips them).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake CLI sleeps per call.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of `remote new` calls that fail.")
+    parser.add_argument("--statuses", default="COMPLETED=0.3,IN_PROGRESS=0.5,AWAITING_USER_FEEDBACK=0.2",
+                        help="Status distribution reported by the fake `remote list`.")
+    parser.add_argument("--history", type=int, default=1000, help="Untracked historical sessions in the fake listing.")
+    parser.add_argument("--preexisting", type=float, default=0.1,
+                        help="Fraction of tasks that already have an untracked remote session (for sync mode).")
+    parser.add_argument("--create-rate", type=float, default=1000.0, help="CREATE_RATE_PER_SECOND during the run.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="auto_agent_bench_")
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+            print(f"Benchmarking parser and editor at {size} tasks...", file=sys.stderr)
+            results += bench_parser_and_editor(size, args.repeat, args.seed, workdir)
+        if args.mode_tasks:
+            print(f"Benchmarking sync/create/review with {args.mode_tasks} tasks...", file=sys.stderr)
+            results += bench_modes(args, workdir)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "arguments": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Process-group handling for Jules CLI calls, shared by auto_agent.py and
+run_smart_tasks.py.
+
+The CLI is an npm wrapper (jules.cmd) that starts node, which may start more
+processes. Killing only the wrapper leaves node running and holding the
+output pipes, so every call with a time limit is started as the leader of its
+own process group and the whole group is killed when the limit is hit:
+- POSIX: start_new_session=True, then os.killpg();
+- Windows: CREATE_NEW_PROCESS_GROUP, then `taskkill /T /F`.
+"""
+import os
+import signal
+import subprocess
+
+
+def new_group_options() -> dict:
+    """Keyword arguments for Popen / asyncio.create_subprocess_exec that make the child a process-group leader."""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_process_tree(pid: int):
+    """Kills the process group led by `pid` (started with new_group_options()) and everything in it."""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_in_process_group(command: list[str], timeout: float, kill_grace: float, check: bool = False,
+                         capture_output: bool = False, **kwargs) -> subprocess.CompletedProcess:
+    """
+    subprocess.run() whose timeout (and Ctrl+C) kills the command's whole
+    process group. After the kill, output is collected for at most
+    `kill_grace` seconds, since a child outside the group could still hold
+    the pipes. Raises subprocess.TimeoutExpired like subprocess.run().
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    with subprocess.Popen(command, **kwargs, **new_group_options()) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process.pid)
+            try:
+                stdout, stderr = process.communicate(timeout=kill_grace)
+            except subprocess.TimeoutExpired:
+                stdout = stderr = None
+            raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+        except BaseException:
+            # The group does not receive the terminal's Ctrl+C, so it is killed here.
+            kill_process_tree(process.pid)
+            raise
+    result = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
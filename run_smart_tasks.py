@@ -1,5 +1,11 @@
+import argparse
+import asyncio
 import os
 import subprocess
+import time
+
+from process_tree import kill_process_tree, new_group_options
+from todo_parser import parse_pending_tasks
 
 # --- Configuration ---
 
@@ -17,6 +23,11 @@ TODO_FILENAME = "TODO.md"
 # Remember to use forward slashes (/) or double-backslashes (\\).
 JULES_EXECUTABLE_PATH = "C:/Users/power/AppData/Roaming/npm/jules.cmd"
 
+# Settings for --async mode.
+ASYNC_MAX_CONCURRENT = 4      # CLI calls running at the same time.
+ASYNC_CALL_TIMEOUT = 300      # Seconds before a CLI call is killed and reported as timed out.
+ASYNC_KILL_GRACE = 5          # Seconds to wait for a finished or killed call's output pipes to close.
+
 # --- End Configuration ---
 
 
@@ -24,57 +35,12 @@ def parse_structured_todo(filename: str) -> list[str]:
     """
     Parses a structured TODO.md file to extract detailed, multi-line task prompts.
     It only looks for tasks under a '## **Pending Tasks**' heading.
+    Parsing is shared with auto_agent.py through the cached index in todo_parser.
     """
-    prompts = []
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
+    if not os.path.exists(filename):
         print(f"Error: '{filename}' not found in the current directory.")
         return []
-
-    in_pending_section = False
-    is_capturing_task = False
-    current_task_lines = []
-
-    for line in lines:
-        stripped_line = line.strip()
-
-        # Check for section boundaries
-        if stripped_line.startswith('## **Pending Tasks**'):
-            in_pending_section = True
-            continue
-        elif stripped_line.startswith('## **Completed Tasks**'):
-            in_pending_section = False
-            continue
-
-        # If we are not in the pending section, skip to the next line
-        if not in_pending_section:
-            continue
-        
-        # '---' is a hard separator between tasks. When we see it, we save
-        # the task we've been building and reset.
-        if stripped_line == '---':
-            if current_task_lines:
-                prompts.append("\n".join(current_task_lines))
-                current_task_lines = []
-            is_capturing_task = False
-            continue
-
-        # '- **Task:**' is the trigger to start capturing lines for a prompt
-        if stripped_line == '- **Task:**':
-            is_capturing_task = True
-            continue # Don't include the literal "- Task:" line in the prompt
-
-        # If we are in "capture mode", add any non-empty line to our current task
-        if is_capturing_task and stripped_line:
-            current_task_lines.append(stripped_line)
-
-    # This handles the very last task in the file, which might not have a '---' after it
-    if current_task_lines:
-        prompts.append("\n".join(current_task_lines))
-
-    return prompts
+    return [record.prompt for record in parse_pending_tasks(filename)]
 
 
 def create_jules_task_with_cli(prompt: str):
@@ -103,8 +69,131 @@ def create_jules_task_with_cli(prompt: str):
         print(f"--> Failed to create task. Jules CLI returned an error:\n{e.stderr}")
 
 
+async def _relay_lines(stream: asyncio.StreamReader, prefix: str, lines: list[str]):
+    """Prints each line of `stream` as soon as it arrives, and keeps it for the result."""
+    while True:
+        raw_line = await stream.readline()
+        if not raw_line: return
+        line = raw_line.decode("utf-8", errors="replace").rstrip()
+        lines.append(line)
+        print(f"{prefix} {line}")
+
+
+async def create_jules_task_async(number: int, prompt: str, semaphore: asyncio.Semaphore, timeout: float) -> dict:
+    """
+    Runs one `jules remote new` call as an asyncio subprocess, streaming its
+    stdout/stderr with a "[number]" prefix. The process is killed when it
+    exceeds `timeout` seconds or the batch is cancelled.
+    Returns a result row for the summary table.
+    """
+    first_line = prompt.splitlines()[0]
+    result = {"number": number, "task": first_line, "outcome": "FAILED", "duration": 0.0, "detail": ""}
+    try:
+        async with semaphore:
+            print(f"[{number}] -> Creating task: {first_line}")
+            command = [JULES_EXECUTABLE_PATH, "remote", "new", "--repo", ".", "--session", prompt]
+            started = time.perf_counter()
+            try:
+                await _run_cli_call(number, command, timeout, result)
+            finally:
+                result["duration"] = time.perf_counter() - started
+                print(f"[{number}] <- {result['outcome']} in {result['duration']:.1f}s")
+    except asyncio.CancelledError:
+        # Reported in the summary rather than propagated: the batch is being stopped anyway.
+        result["outcome"] = "CANCELLED"
+    return result
+
+
+async def _wait_for_exit(process: asyncio.subprocess.Process, timeout: float) -> bool:
+    """
+    Waits up to `timeout` seconds for the process itself to exit. Unlike
+    Process.wait(), this does not also wait for its output pipes to close,
+    which a child it left running can hold open indefinitely.
+    """
+    deadline = time.monotonic() + timeout
+    while process.returncode is None:
+        if time.monotonic() >= deadline: return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+async def _run_cli_call(number: int, command: list[str], timeout: float, result: dict):
+    # Each call leads its own process group, so a timeout or Ctrl+C can kill the wrapper's children too.
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, **new_group_options())
+    except FileNotFoundError:
+        result["detail"] = f"executable not found: {JULES_EXECUTABLE_PATH}"
+        return
+    stdout_lines, stderr_lines = [], []
+    readers = [asyncio.create_task(_relay_lines(process.stdout, f"[{number}]", stdout_lines)),
+               asyncio.create_task(_relay_lines(process.stderr, f"[{number}] !", stderr_lines))]
+    try:
+        if not await _wait_for_exit(process, timeout):
+            result["outcome"] = "TIMEOUT"
+            result["detail"] = f"no exit after {timeout:.0f}s"
+            return
+        # A child left running can hold the pipes open after the wrapper exits.
+        await asyncio.wait(readers, timeout=ASYNC_KILL_GRACE)
+        if process.returncode == 0:
+            result["outcome"] = "OK"
+            result["detail"] = next((line for line in stdout_lines if "id:" in line.lower()), "")
+        else:
+            result["detail"] = stderr_lines[-1] if stderr_lines else f"exit code {process.returncode}"
+    except asyncio.CancelledError:
+        result["outcome"] = "CANCELLED"
+        raise
+    finally:
+        if process.returncode is None or not all(reader.done() for reader in readers):
+            await asyncio.to_thread(kill_process_tree, process.pid)
+            if not await _wait_for_exit(process, ASYNC_KILL_GRACE):
+                print(f"[{number}] ! Process {process.pid} did not exit after being killed; leaving it behind.")
+            await asyncio.wait(readers, timeout=ASYNC_KILL_GRACE)
+        for reader in readers: reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+
+async def run_tasks_async(prompts: list[str], max_concurrent: int, timeout: float) -> list[dict]:
+    """Creates every task concurrently. On Ctrl+C the running calls are killed and the finished ones still reported."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tasks = [asyncio.create_task(create_jules_task_async(number, prompt, semaphore, timeout))
+             for number, prompt in enumerate(prompts, 1)]
+    try:
+        return await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        for task in tasks: task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Tasks cancelled before they started never produced a row of their own.
+        return [result if isinstance(result, dict) else
+                {"number": number, "task": prompt.splitlines()[0], "outcome": "CANCELLED", "duration": 0.0, "detail": ""}
+                for number, (result, prompt) in enumerate(zip(results, prompts), 1)]
+
+
+def print_summary(results: list[dict]):
+    """Prints one row per CLI call, then the totals."""
+    print("\n---")
+    print(f"{'#':>4}  {'Result':<9} {'Time':>7}  Task")
+    for result in sorted(results, key=lambda r: r["number"]):
+        task = result["task"] if len(result["task"]) <= 60 else result["task"][:59] + "…"
+        print(f"{result['number']:>4}  {result['outcome']:<9} {result['duration']:>6.1f}s  {task}")
+        if result["outcome"] != "OK" and result["detail"]:
+            print(f"{'':>4}  {'':<9} {'':>7}  {result['detail']}")
+    succeeded = sum(result["outcome"] == "OK" for result in results)
+    print(f"\n{succeeded} succeeded, {len(results) - succeeded} failed, "
+          f"{sum(result['duration'] for result in results):.1f}s of CLI time.")
+
+
 def main():
     """Main function to parse the file and execute the tasks."""
+    parser = argparse.ArgumentParser(description=f"Creates a Jules session for every pending task in {TODO_FILENAME}.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run the CLI calls concurrently, streaming their output, and print a summary table.")
+    parser.add_argument("--concurrency", type=int, default=ASYNC_MAX_CONCURRENT,
+                        help="--async: CLI calls running at the same time.")
+    parser.add_argument("--timeout", type=float, default=ASYNC_CALL_TIMEOUT,
+                        help="--async: seconds before a CLI call is killed.")
+    args = parser.parse_args()
+
     if "YourUsername" in JULES_EXECUTABLE_PATH:
         print("ERROR: You have not configured the script yet.")
         print("Please open the script and edit the 'JULES_EXECUTABLE_PATH' variable.")
@@ -118,9 +207,18 @@ def main():
         return
 
     print(f"\nFound {len(prompts)} pending tasks. Starting creation process...")
-    for prompt in prompts:
-        create_jules_task_with_cli(prompt)
-    
+    if args.use_async:
+        results = []
+        try:
+            results = asyncio.run(run_tasks_async(prompts, max(1, args.concurrency), args.timeout))
+        except KeyboardInterrupt:
+            print("\nInterrupted; running CLI calls were stopped.")
+        if results:
+            print_summary(results)
+    else:
+        for prompt in prompts:
+            create_jules_task_with_cli(prompt)
+
     print("\n---")
     print("Script finished.")
 
@@ -0,0 +1,298 @@
+"""
+Shared parser for the structured TODO.md used by auto_agent.py and
+run_smart_tasks.py.
+
+TODO.md is split into `---`-delimited blocks under the '## **Pending Tasks**'
+and '## **Completed Tasks**' headings. Each block becomes a TaskRecord with
+its byte range in the file, so callers can edit the file without
+re-scanning it.
+
+Tasks are identified by hash_prompt(), a hash of the prompt's canonical form
+(normalize_prompt), so reflowing or renumbering a task keeps its identity;
+PromptSimilarityIndex finds tasks whose wording was edited.
+
+Parsed blocks are cached in an index file under INDEX_DIR, keyed on the
+file's size, mtime and content hash:
+- an unchanged file is loaded straight from the index without being read;
+- an edited file is re-split, but only blocks whose bytes changed are
+  re-parsed and re-hashed.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+
+# --- Configuration ---
+INDEX_DIR = ".jules"              # Where parsed-block indexes are kept (one per TODO file).
+INDEX_VERSION = 4                 # Bump when TaskRecord or the parsing rules change.
+RACY_MTIME_WINDOW_NS = 2_000_000_000  # Edits this close to indexing time may share its mtime, so re-check content.
+# --- End Configuration ---
+
+PENDING_HEADER = '## **Pending Tasks**'
+COMPLETED_HEADER = '## **Completed Tasks**'
+SECTION_HEADERS = {PENDING_HEADER: "pending", COMPLETED_HEADER: "completed"}
+
+
+@dataclass
+class TaskRecord:
+    prompt_hash: str          # hash_prompt(prompt); "" when the block has no '- **Task:**' list.
+    prompt: str               # Stripped, non-empty lines after '- **Task:**', joined with newlines.
+    section: str | None       # "pending", "completed", or None above the first heading.
+    role: str | None          # From the '### **Role**' heading, e.g. "Programmer".
+    assignee: str | None
+    status: str | None
+    goal: str | None
+    priority: str | None      # Optional '- **Priority:**' field, e.g. "High" or "1".
+    start: int                # Byte offset of the block's opening '---' line.
+    end: int                  # Byte offset just past the block (the next '---' or heading).
+
+
+@dataclass
+class TodoIndex:
+    path: str
+    records: list[TaskRecord]
+    # Section name -> (offset of the heading line, offset just past the heading
+    # and the '---' line directly under it, where new blocks can be inserted).
+    sections: dict[str, tuple[int, int]]
+
+    def pending(self) -> list[TaskRecord]:
+        return [record for record in self.records if record.section == "pending" and record.prompt]
+
+
+_LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*+])\s+")
+# A span wrapped in matching emphasis or code markers (**x**, *x*, ~~x~~, `x`, _x_). Underscores only count
+# at word edges, so identifiers such as resource_manager.gd keep theirs.
+_MARKDOWN_EMPHASIS = re.compile(r"(\*{1,3}|~~|`+)(?=\S)(.+?)(?<=\S)\1"
+                                r"|(?<!\w)(_{1,3})(?=[^\s_])(.+?)(?<=[^\s_])\3(?!\w)")
+# Markers left unpaired at a word edge, e.g. where a session description was truncated mid-span.
+_DANGLING_EMPHASIS = re.compile(r"(?:^|(?<=\s))[*`~]+|[*`~]+(?=\s|$)")
+_TRUNCATION_MARK = re.compile(r"(?:…|\.\.\.)\s*$")
+
+
+def normalize_task_line(text: str) -> str:
+    """
+    Canonical form of a single task line or a session description, for
+    matching one against the other: list numbering, markdown emphasis, a
+    trailing truncation ellipsis and case/whitespace differences are removed.
+    Emphasis markers are only removed around a word or span, never inside one.
+    """
+    text = _TRUNCATION_MARK.sub("", text.strip())
+    text = _LIST_MARKER.sub("", text)
+    for _ in range(3):  # Nested spans, e.g. **`x`**.
+        unwrapped = _MARKDOWN_EMPHASIS.sub(lambda match: match.group(2) or match.group(4), text)
+        if unwrapped == text: break
+        text = unwrapped
+    text = _DANGLING_EMPHASIS.sub("", text)
+    return " ".join(text.lower().split())
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Canonical form of a whole task prompt: every line normalized as by
+    normalize_task_line and joined with single spaces, so whitespace, line
+    wrapping, list numbering, markdown emphasis and case do not matter.
+    """
+    return " ".join(filter(None, (normalize_task_line(line) for line in prompt.splitlines())))
+
+
+def hash_prompt(prompt: str) -> str:
+    """Stable identity of a task: sha256 of its canonical form (see normalize_prompt)."""
+    return hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+
+class PromptSimilarityIndex:
+    """
+    Finds prompts that are worded almost the same as a given one. Each prompt
+    is reduced to the set of word pairs of its canonical form, and an inverted
+    index from pair to prompts yields the overlap with every candidate in one
+    pass; similarity is the Jaccard index of the two sets.
+    """
+    def __init__(self):
+        self.shingles = {}
+        self.postings = {}
+
+    @staticmethod
+    def _shingles(prompt: str) -> set[str]:
+        words = normalize_prompt(prompt).split()
+        if len(words) < 2: return set(words)
+        return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+    def add(self, key, prompt: str):
+        shingles = self._shingles(prompt)
+        self.shingles[key] = shingles
+        for shingle in shingles:
+            self.postings.setdefault(shingle, set()).add(key)
+
+    def similar(self, prompt: str, threshold: float) -> list[tuple[object, float]]:
+        """Returns (key, similarity) for every indexed prompt at or above `threshold`, most similar first."""
+        shingles = self._shingles(prompt)
+        overlap = {}
+        for shingle in shingles:
+            for key in self.postings.get(shingle, ()):
+                overlap[key] = overlap.get(key, 0) + 1
+        matches = []
+        for key, shared in overlap.items():
+            score = shared / (len(shingles) + len(self.shingles[key]) - shared)
+            if score >= threshold: matches.append((key, score))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+
+def extract_block_prompt(block_lines: list[str]) -> str:
+    """Returns the prompt under '- **Task:**' in a task block, one stripped line per line."""
+    task_lines = []
+    is_task_section = False
+    for block_line in block_lines:
+        if block_line.strip() == '- **Task:**':
+            is_task_section = True
+            continue
+        if is_task_section and block_line.strip():
+            task_lines.append(block_line.strip())
+    return "\n".join(task_lines)
+
+
+def _field_value(stripped_line: str, field: str) -> str | None:
+    prefix = f'- **{field}:**'
+    if not stripped_line.startswith(prefix): return None
+    return stripped_line[len(prefix):].strip() or None
+
+
+def _parse_block(block_text: str) -> dict:
+    """Parses the fields of one block. The result is independent of where the block sits."""
+    lines = block_text.splitlines()
+    fields = {"role": None, "assignee": None, "status": None, "goal": None, "priority": None}
+    for line in lines:
+        stripped_line = line.strip()
+        if stripped_line.startswith('### ') and fields["role"] is None:
+            fields["role"] = stripped_line[4:].strip('* ') or None
+            continue
+        for field in ("Assignee", "Status", "Goal", "Priority"):
+            value = _field_value(stripped_line, field)
+            if value is not None and fields[field.lower()] is None:
+                fields[field.lower()] = value
+    prompt = extract_block_prompt(lines)
+    fields["prompt"] = prompt
+    fields["prompt_hash"] = hash_prompt(prompt) if prompt else ""
+    return fields
+
+
+def _split_blocks(data: bytes) -> tuple[list[tuple[str | None, int, int]], dict[str, tuple[int, int]]]:
+    """
+    Returns ([(section, start, end), ...], sections) for `data`. A block runs
+    from a '---' line (or the line after a heading) up to the next '---' line
+    or heading.
+    """
+    sections = {}
+    blocks = []
+    section = None
+    block_start = 0
+    offset = 0
+    for line in data.splitlines(keepends=True):
+        line_start, offset = offset, offset + len(line)
+        stripped_line = line.strip()
+        heading = next((name for header, name in SECTION_HEADERS.items()
+                        if stripped_line.startswith(header.encode())), None)
+        if heading is None and stripped_line != b'---':
+            continue
+        if line_start > block_start:
+            blocks.append((section, block_start, line_start))
+        if heading is not None:
+            section = heading
+            sections[heading] = [line_start, offset]
+            block_start = offset
+            continue
+        if section is not None and sections[section][1] == line_start:
+            # The '---' right under a heading belongs to the heading, not to a block.
+            sections[section][1] = offset
+            block_start = offset
+            continue
+        block_start = line_start
+    if offset > block_start:
+        blocks.append((section, block_start, offset))
+    return blocks, {name: tuple(span) for name, span in sections.items()}
+
+
+def _index_path(todo_path: str) -> str:
+    key = hashlib.sha1(os.path.abspath(todo_path).encode()).hexdigest()[:16]
+    return os.path.join(INDEX_DIR, f"todo_index-{key}.json")
+
+
+def _load_cache(todo_path: str) -> dict:
+    try:
+        with open(_index_path(todo_path), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if cache.get("version") == INDEX_VERSION else {}
+
+
+def _save_cache(todo_path: str, cache: dict):
+    index_path = _index_path(todo_path)
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(f"{index_path}.tmp", index_path)
+    except OSError:
+        pass  # The index is only a cache; parsing already succeeded.
+
+
+def _records_from_cache(cache: dict) -> list[TaskRecord]:
+    blocks = cache["blocks"]
+    return [TaskRecord(section=section, start=start, end=end, **blocks[block_key])
+            for block_key, section, start, end in cache["records"]]
+
+
+def load_todo_index(todo_path: str, use_cache: bool = True) -> TodoIndex:
+    """
+    Returns every block in `todo_path` as a TaskRecord. Raises FileNotFoundError
+    if the file does not exist.
+    """
+    stat = os.stat(todo_path)
+    cache = _load_cache(todo_path) if use_cache else {}
+    if (cache.get("size") == stat.st_size and cache.get("mtime_ns") == stat.st_mtime_ns
+            and stat.st_mtime_ns < cache.get("indexed_at_ns", 0) - RACY_MTIME_WINDOW_NS):
+        return TodoIndex(todo_path, _records_from_cache(cache),
+                         {name: tuple(span) for name, span in cache["sections"].items()})
+
+    with open(todo_path, 'rb') as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    if cache.get("content_hash") == content_hash:
+        block_refs = cache["records"]
+        block_fields = cache["blocks"]
+        sections = {name: tuple(span) for name, span in cache["sections"].items()}
+    else:
+        cached_fields = cache.get("blocks", {})
+        block_refs = []
+        block_fields = {}
+        blocks, sections = _split_blocks(data)
+        for section, start, end in blocks:
+            block_key = hashlib.sha1(data[start:end]).hexdigest()
+            if block_key not in block_fields:
+                block_fields[block_key] = cached_fields.get(block_key) or \
+                    _parse_block(data[start:end].decode('utf-8', errors='replace'))
+            block_refs.append((block_key, section, start, end))
+
+    cache = {
+        "version": INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "indexed_at_ns": time.time_ns(),
+        "content_hash": content_hash,
+        "sections": sections,
+        "records": block_refs,
+        "blocks": block_fields,
+    }
+    if use_cache:
+        _save_cache(todo_path, cache)
+    return TodoIndex(todo_path, _records_from_cache(cache), sections)
+
+
+def parse_pending_tasks(todo_path: str) -> list[TaskRecord]:
+    """Returns the pending tasks in file order, or [] if the file does not exist."""
+    try:
+        return load_todo_index(todo_path).pending()
+    except FileNotFoundError:
+        return []